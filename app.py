@@ -22,21 +22,45 @@ Autor: Sistema de Gestión Institucional
 # IMPORTACIONES
 # ============================================================================
 from flask import Flask, render_template, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime
-import json
+import gzip
 from pathlib import Path
 
+# Escritura JSON compartida; orjson es opcional (None si no está instalado)
+from processors.json_rapido import orjson, guardar_json
+
 # Procesadores optimizados de documentos
 from processors.docx_processor_optimized import process_docx
-from processors.xlsx_processor_optimized import process_xlsx
+from processors.xlsx_processor_optimized import process_xlsx, obtener_imagen_base64
 
 # ============================================================================
 # CONFIGURACIÓN DE LA APLICACIÓN
 # ============================================================================
 app = Flask(__name__)
 
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask basado en orjson (respuestas de jsonify)."""
+
+    def dumps(self, obj, **kwargs):
+        # Fechas y dataclasses pasan por default, como en el proveedor de Flask
+        opciones = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if kwargs.get('sort_keys', self.sort_keys):
+            opciones |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            opciones |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=opciones).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+if orjson is not None:
+    app.json = ORJSONProvider(app)
+
 # Configuración de seguridad y límites
 app.config['SECRET_KEY'] = 'solventacion-2024-secure-key'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB máximo por archivo
@@ -45,6 +69,7 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB máximo por archivo
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['RESULTS_FOLDER'] = 'resultados'
 app.config['ALLOWED_EXTENSIONS'] = {'docx', 'xlsx'}
+app.config['COMPRESS_MIN_SIZE'] = 1024  # Bytes mínimos para comprimir respuestas JSON
 
 # Crear carpetas necesarias si no existen
 Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
@@ -67,6 +92,36 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 
+@app.after_request
+def comprimir_respuesta(response):
+    """
+    Comprime con gzip las respuestas JSON grandes si el navegador lo acepta.
+
+    El HTML de las hojas completas hace que /upload devuelva varios MB de texto
+    muy repetitivo; gzip nivel 1 lo reduce varias veces a un costo mínimo.
+
+    Args:
+        response: Respuesta generada por la ruta
+
+    Returns:
+        La misma respuesta, comprimida cuando aplica
+    """
+    if (response.direct_passthrough
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+        return response
+
+    datos = response.get_data()
+    if len(datos) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.set_data(gzip.compress(datos, compresslevel=1))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 # ============================================================================
 # RUTAS DE LA APLICACIÓN
 # ============================================================================
@@ -113,20 +168,21 @@ def upload_file():
                 if ext == 'docx':
                     data = process_docx(filepath)
                 elif ext == 'xlsx':
-                    data = process_xlsx(filepath)
+                    # Las imágenes van sin sus datos: se piden aparte en /api/imagen
+                    data = process_xlsx(filepath, incluir_base64=False)
 
                 # Guardar resultado en JSON
                 result_filename = f"resultado_{timestamp}_{filename}.json"
                 result_path = os.path.join(app.config['RESULTS_FOLDER'], result_filename)
 
-                with open(result_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                guardar_json(result_path, data)
 
                 results.append({
                     'filename': filename,
                     'status': 'success',
                     'data': data,
-                    'result_file': result_filename
+                    'result_file': result_filename,
+                    'upload_file': unique_filename
                 })
             else:
                 results.append({
@@ -158,6 +214,26 @@ def download_result(filename):
         return jsonify({'error': str(e)}), 404
 
 
+@app.route('/api/imagen/<filename>/<hoja>/<int:indice>')
+def get_imagen(filename, hoja, indice):
+    """
+    Devuelve en base64 una imagen de un archivo XLSX subido.
+
+    Args:
+        filename (str): Nombre del archivo subido ('upload_file' de /upload)
+        hoja (str): Nombre de la hoja
+        indice (int): Índice de la imagen en la hoja (empieza en 1)
+
+    Returns:
+        JSON con los datos de la imagen o error 404
+    """
+    try:
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+        return jsonify({'datos_base64': obtener_imagen_base64(filepath, hoja, indice)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 404
+
+
 @app.route('/api/stats')
 def get_stats():
     """
@@ -6,10 +6,16 @@ Extrae propuestas de solventación, metadatos, y detecta imágenes
 import os
 import unicodedata
 from datetime import datetime
+from functools import lru_cache
 from docx import Document
 from html import escape
 
+# Vocales acentuadas y eñe: equivalen a NFD sin marcas diacríticas
+_ACENTOS = str.maketrans('ÁÉÍÓÚÜÑáéíóúüñ', 'AEIOUUNaeiouun')
 
+
+# Los encabezados de celda se repiten fila tras fila: se memoriza el resultado
+@lru_cache(maxsize=4096)
 def normalizar_texto(texto):
     """
     Normaliza texto eliminando acentos y convirtiendo a mayúsculas.
@@ -22,6 +28,10 @@ def normalizar_texto(texto):
     """
     if not texto:
         return ""
+    # Caso común: solo acentos del español, se resuelven en una pasada
+    texto = texto.translate(_ACENTOS)
+    if texto.isascii():
+        return texto.upper()
     # Eliminar acentos
     texto_nfd = unicodedata.normalize('NFD', texto)
     texto_sin_acentos = ''.join(c for c in texto_nfd if unicodedata.category(c) != 'Mn')
@@ -9,6 +9,8 @@ import io
 import base64
 import unicodedata
 from datetime import datetime
+from functools import lru_cache
+from pathlib import PurePosixPath
 from typing import Dict, List, Any, Optional
 from docx import Document
 from docx.oxml.text.paragraph import CT_P
@@ -17,6 +19,42 @@ from docx.table import Table
 from docx.text.paragraph import Paragraph
 from html import escape
 import re
+from processors.respuesta_openai import parsear_respuesta_json
+
+# Vocales acentuadas y eñe: equivalen a NFD sin marcas diacríticas
+_ACENTOS = str.maketrans('ÁÉÍÓÚÜÑáéíóúüñ', 'AEIOUUNaeiouun')
+
+# Fechas en varios formatos (extraer_informacion_adicional): una sola alternancia,
+# el texto se recorre una vez y las fechas salen en orden de aparición
+_FECHA_RE = re.compile('|'.join(f'(?:{patron})' for patron in (
+    r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b',  # dd/mm/yyyy o dd-mm-yyyy
+    r'\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b',  # yyyy/mm/dd
+    r'\b(?:enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s+(?:de\s+)?\d{4}\b',
+    r'\b(?:ene|feb|mar|abr|may|jun|jul|ago|sep|oct|nov|dic)[a-z]*\.?\s+\d{4}\b'
+)), re.IGNORECASE)
+
+# Referencias numéricas (extraer_informacion_adicional)
+_REFERENCIA_RE = re.compile(r'\b(?:ref|referencia|no|número|num)\.?\s*:?\s*(\d+(?:[/-]\d+)*)\b', re.IGNORECASE)
+
+# Palabras clave buscadas en extraer_informacion_adicional (ya en minúsculas)
+_PALABRAS_RESPONSABLE = ('responsable:', 'encargado:', 'titular:', 'director:', 'coordinador:', 'jefe:')
+_PALABRAS_IMPORTANTES = ('cumplimiento', 'incumplimiento', 'pendiente', 'realizado', 'en proceso',
+                         'evidencia', 'documentación', 'plazo', 'vencimiento', 'urgente', 'prioritario')
+
+
+# Los encabezados de celda se repiten fila tras fila: se memoriza el resultado
+@lru_cache(maxsize=4096)
+def _normalizar_texto(texto: str) -> str:
+    """Elimina acentos y convierte a mayúsculas (implementación cacheada)"""
+    if not texto:
+        return ""
+    # Caso común: solo acentos del español, se resuelven en una pasada
+    texto = texto.translate(_ACENTOS)
+    if texto.isascii():
+        return texto.upper()
+    texto_nfd = unicodedata.normalize('NFD', texto)
+    texto_sin_acentos = ''.join(c for c in texto_nfd if unicodedata.category(c) != 'Mn')
+    return texto_sin_acentos.upper()
 
 
 class DOCXProcessorOptimized:
@@ -45,11 +83,7 @@ class DOCXProcessorOptimized:
 
     def normalizar_texto(self, texto: str) -> str:
         """Normaliza texto eliminando acentos y convirtiendo a mayúsculas"""
-        if not texto:
-            return ""
-        texto_nfd = unicodedata.normalize('NFD', texto)
-        texto_sin_acentos = ''.join(c for c in texto_nfd if unicodedata.category(c) != 'Mn')
-        return texto_sin_acentos.upper()
+        return _normalizar_texto(texto)
 
     def extraer_estilo_run(self, run) -> Dict[str, Any]:
         """Extrae información de estilo de un run"""
@@ -168,26 +202,20 @@ class DOCXProcessorOptimized:
 
     def tabla_a_html(self, tabla: Table) -> str:
         """Convierte una tabla completa a HTML preservando estilos"""
-        html = "<table border='1' style='border-collapse: collapse; width:100%;'>\n"
+        partes = ["<table border='1' style='border-collapse: collapse; width:100%;'>\n"]
 
         for fila in tabla.rows:
-            html += "<tr>\n"
+            partes.append("<tr>\n")
             for celda in fila.cells:
-                # Extraer contenido de la celda (puede contener múltiples párrafos)
-                contenido_celda = ""
-                for parrafo in celda.paragraphs:
-                    contenido_celda += self.parrafo_a_html(parrafo)
-
-                # También puede contener tablas anidadas
-                for tabla_anidada in celda.tables:
-                    contenido_celda += self.tabla_a_html(tabla_anidada)
+                # Contenido de la celda (múltiples párrafos y posibles tablas anidadas) en un solo f-string
+                parrafos_html = ''.join([self.parrafo_a_html(parrafo) for parrafo in celda.paragraphs])
+                tablas_html = ''.join([self.tabla_a_html(tabla_anidada) for tabla_anidada in celda.tables])
+                partes.append(f"<td style='padding:5px'>{parrafos_html}{tablas_html}</td>\n")
 
-                html += f"<td style='padding:5px'>{contenido_celda}</td>\n"
+            partes.append("</tr>\n")
 
-            html += "</tr>\n"
-
-        html += "</table>"
-        return html
+        partes.append("</table>")
+        return ''.join(partes)
 
     def extraer_imagenes(self, doc: Document) -> List[Dict[str, Any]]:
         """Extrae todas las imágenes del documento con sus datos binarios"""
@@ -197,11 +225,13 @@ class DOCXProcessorOptimized:
             # Obtener imágenes de las relaciones
             for idx, rel in enumerate(doc.part.rels.values()):
                 if "image" in rel.target_ref:
+                    # Las URIs de relaciones siempre usan separador posix
+                    ruta_imagen = PurePosixPath(rel.target_ref)
                     imagen_data = {
                         'indice': idx + 1,
-                        'tipo': rel.target_ref.split('.')[-1],
+                        'tipo': ruta_imagen.suffix[1:],
                         'relacion_id': rel.rId,
-                        'nombre': os.path.basename(rel.target_ref),
+                        'nombre': ruta_imagen.name,
                         'datos_base64': None
                     }
 
@@ -272,37 +302,25 @@ class DOCXProcessorOptimized:
         }
 
         # Buscar fechas (varios formatos)
-        import re
-        patrones_fecha = [
-            r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b',  # dd/mm/yyyy o dd-mm-yyyy
-            r'\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b',  # yyyy/mm/dd
-            r'\b(?:enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s+(?:de\s+)?\d{4}\b',
-            r'\b(?:ene|feb|mar|abr|may|jun|jul|ago|sep|oct|nov|dic)[a-z]*\.?\s+\d{4}\b'
-        ]
-
-        for patron in patrones_fecha:
-            fechas_encontradas = re.findall(patron, texto, re.IGNORECASE)
-            info['fechas'].extend(fechas_encontradas)
+        info['fechas'].extend(_FECHA_RE.findall(texto))
+
+        # Minúsculas una sola vez para todas las búsquedas por palabra clave
+        texto_lower = texto.lower()
 
         # Buscar responsables (palabras clave comunes)
-        palabras_responsable = ['responsable:', 'encargado:', 'titular:', 'director:', 'coordinador:', 'jefe:']
-        for palabra in palabras_responsable:
-            if palabra in texto.lower():
+        for palabra in _PALABRAS_RESPONSABLE:
+            inicio = texto_lower.find(palabra)
+            if inicio != -1:
                 # Extraer texto después de la palabra clave
-                inicio = texto.lower().find(palabra)
                 fragmento = texto[inicio:inicio+100]
                 info['responsables'].append(fragmento)
 
         # Buscar referencias numéricas
-        referencias = re.findall(r'\b(?:ref|referencia|no|número|num)\.?\s*:?\s*(\d+(?:[/-]\d+)*)\b', texto, re.IGNORECASE)
+        referencias = _REFERENCIA_RE.findall(texto)
         info['referencias'].extend(referencias)
 
         # Palabras clave importantes
-        palabras_importantes = ['cumplimiento', 'incumplimiento', 'pendiente', 'realizado', 'en proceso',
-                                'evidencia', 'documentación', 'plazo', 'vencimiento', 'urgente', 'prioritario']
-        for palabra in palabras_importantes:
-            if palabra in texto.lower():
-                info['palabras_clave'].append(palabra)
+        info['palabras_clave'].extend(palabra for palabra in _PALABRAS_IMPORTANTES if palabra in texto_lower)
 
         return info
 
@@ -345,29 +363,30 @@ class DOCXProcessorOptimized:
 
                     # Buscar PROPUESTA DE SOLVENTACIÓN
                     if "PROPUESTA" in cell_text_norm and "SOLVENTACION" in cell_text_norm:
-                        propuesta_html = ""
-                        propuesta_texto = ""
+                        # Fragmentos acumulados en listas y unidos una sola vez
+                        partes_html = []
+                        partes_texto = []
 
                         # Extraer contenido de la celda siguiente
                         if idx + 1 < len(row.cells):
                             # Extraer párrafos
                             for parrafo in row.cells[idx + 1].paragraphs:
-                                parrafo_html = self.parrafo_a_html(parrafo)
-                                propuesta_html += parrafo_html
-                                propuesta_texto += parrafo.text + " "
+                                partes_html.append(self.parrafo_a_html(parrafo))
+                                partes_texto.append(parrafo.text)
 
                             # Extraer tablas anidadas
                             try:
                                 for tabla_anidada in row.cells[idx + 1].tables:
-                                    tabla_html = self.tabla_a_html(tabla_anidada)
-                                    propuesta_html += tabla_html
+                                    partes_html.append(self.tabla_a_html(tabla_anidada))
                                     # Extraer texto de tabla anidada
                                     for fila in tabla_anidada.rows:
-                                        for celda in fila.cells:
-                                            propuesta_texto += celda.text + " "
+                                        partes_texto.extend(celda.text for celda in fila.cells)
                             except (IndexError, AttributeError):
                                 pass
 
+                        propuesta_html = "".join(partes_html)
+                        propuesta_texto = "".join(f"{texto} " for texto in partes_texto)
+
                 # Agregar propuesta si se encontró
                 if propuesta_html and propuesta_html.strip():
                     # Extraer información adicional
@@ -465,17 +484,8 @@ IMPORTANTE: Solo devuelve el JSON, sin texto adicional."""
                 max_tokens=2000
             )
 
-            # Parsear respuesta
-            import json
-            respuesta_texto = response.choices[0].message.content.strip()
-
-            # Limpiar markdown si existe
-            if respuesta_texto.startswith('```'):
-                respuesta_texto = respuesta_texto.split('```')[1]
-                if respuesta_texto.startswith('json'):
-                    respuesta_texto = respuesta_texto[4:]
-
-            resultado = json.loads(respuesta_texto)
+            # Parsear respuesta (con o sin bloque markdown ```json ... ```)
+            resultado = parsear_respuesta_json(response.choices[0].message.content)
 
             # Formatear propuestas
             propuestas = []
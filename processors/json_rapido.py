@@ -0,0 +1,31 @@
+"""
+Escritura de archivos JSON compartida por la aplicación web y el procesador por lotes
+"""
+
+import json
+
+# Serializador JSON rápido (Opcional - si falta se usa json)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def guardar_json(ruta, datos):
+    """
+    Guarda datos en un archivo JSON legible (UTF-8, indentado a 2 espacios).
+
+    Usa orjson si está disponible. Los datos son los mismos que con json.dump, pero
+    no el texto: algunos float cambian de notación (1e-05 se escribe 0.00001) y
+    NaN e Infinity se escriben como null.
+
+    Args:
+        ruta (str | Path): Ruta del archivo de salida
+        datos: Datos serializables a JSON
+    """
+    if orjson is not None:
+        with open(ruta, 'wb') as f:
+            f.write(orjson.dumps(datos, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
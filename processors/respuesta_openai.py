@@ -0,0 +1,35 @@
+"""
+Utilidades compartidas para interpretar las respuestas JSON de OpenAI
+"""
+
+import re
+
+# Parser JSON: orjson si está instalado, la biblioteca estándar si no
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+# Bloque de código markdown (```json ... ```) en cualquier parte de la respuesta;
+# si falta la valla de cierre, el bloque llega hasta el final del texto
+_BLOQUE_MARKDOWN_RE = re.compile(r'```(?:json)?\s*(.*?)\s*(?:```|$)', re.DOTALL | re.IGNORECASE)
+
+
+def parsear_respuesta_json(respuesta_texto: str):
+    """
+    Convierte la respuesta de OpenAI en un objeto JSON, ignorando el bloque
+    markdown que la envuelva y el texto que la acompañe.
+
+    Args:
+        respuesta_texto: Contenido del mensaje devuelto por el modelo
+
+    Returns:
+        Objeto JSON decodificado (lanza ValueError si no es JSON válido)
+    """
+    respuesta_texto = respuesta_texto.strip()
+
+    bloque = _BLOQUE_MARKDOWN_RE.search(respuesta_texto)
+    if bloque:
+        respuesta_texto = bloque.group(1)
+
+    return _json_loads(respuesta_texto)
@@ -4,12 +4,22 @@ Extrae propuestas de solventación, metadatos, y detecta imágenes
 """
 
 import os
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
 from datetime import datetime
-import pandas as pd
 from html import escape
 from openpyxl import load_workbook
 from openpyxl.drawing.image import Image as OpenpyxlImage
 
+# Espacios de nombres OOXML usados al inspeccionar el zip
+_NS_PAQUETE = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_NS_HOJA = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+# Extensiones de imagen con otro nombre en el formato que reporta openpyxl (Pillow)
+_FORMATOS_IMAGEN = {'jpg': 'jpeg', 'jpe': 'jpeg', 'tif': 'tiff'}
+
 
 def convertir_a_html_crudo(texto):
     """
@@ -27,9 +37,54 @@ def convertir_a_html_crudo(texto):
     return f"<p style='text-align:justify'>{escape(texto)}</p>"
 
 
+def _relaciones_parte(zf, parte):
+    """
+    Lee las relaciones de una parte del paquete XLSX.
+
+    Args:
+        zf (ZipFile): Archivo XLSX abierto como zip.
+        parte (str): Ruta de la parte dentro del zip (p. ej. 'xl/workbook.xml'; '' para el paquete).
+
+    Returns:
+        dict: Id de relación -> (tipo, ruta destino resuelta).
+    """
+    carpeta, nombre = posixpath.split(parte)
+    ruta_rels = posixpath.join(carpeta, '_rels', f'{nombre}.rels')
+    if ruta_rels not in zf.NameToInfo:
+        return {}
+
+    relaciones = {}
+    for rel in ET.fromstring(zf.read(ruta_rels)).iter(f'{_NS_PAQUETE}Relationship'):
+        destino = rel.get('Target', '')
+        if destino.startswith('/'):
+            destino = destino[1:]
+        else:
+            destino = posixpath.normpath(posixpath.join(carpeta, destino))
+        relaciones[rel.get('Id')] = (rel.get('Type', ''), destino)
+    return relaciones
+
+
+def _ruta_libro(zf):
+    """
+    Localiza el libro dentro del paquete XLSX mediante _rels/.rels.
+
+    Args:
+        zf (ZipFile): Archivo XLSX abierto como zip.
+
+    Returns:
+        str: Ruta de la parte del libro (normalmente 'xl/workbook.xml').
+    """
+    for tipo, destino in _relaciones_parte(zf, '').values():
+        if tipo.endswith('/officeDocument'):
+            return destino
+    raise KeyError("El paquete no declara el libro en _rels/.rels")
+
+
 def detectar_imagenes_xlsx(filepath):
     """
     Detecta si el archivo XLSX contiene imágenes.
+    Inspecciona directamente el zip (libro -> hojas -> dibujos -> imágenes)
+    sin cargar las celdas del libro.
 
     Args:
         filepath (str): Ruta del archivo XLSX.
@@ -38,19 +93,27 @@ def detectar_imagenes_xlsx(filepath):
         dict: Información sobre imágenes en el archivo.
     """
     try:
-        wb = load_workbook(filepath)
         imagenes = []
 
-        for sheet_name in wb.sheetnames:
-            sheet = wb[sheet_name]
+        with zipfile.ZipFile(filepath) as zf:
+            ruta_libro = _ruta_libro(zf)
+            rels_libro = _relaciones_parte(zf, ruta_libro)
+            libro = ET.fromstring(zf.read(ruta_libro))
+
+            for hoja in libro.iter(f'{_NS_HOJA}sheet'):
+                _, ruta_hoja = rels_libro.get(hoja.get(f'{_NS_REL}id'), ('', ''))
+
+                for tipo, ruta_dibujo in _relaciones_parte(zf, ruta_hoja).values():
+                    if not tipo.endswith('/drawing'):
+                        continue
 
-            # Buscar imágenes en la hoja
-            if hasattr(sheet, '_images'):
-                for img in sheet._images:
-                    imagenes.append({
-                        'hoja': sheet_name,
-                        'formato': img.format if hasattr(img, 'format') else 'desconocido'
-                    })
+                    for tipo_img, ruta_img in _relaciones_parte(zf, ruta_dibujo).values():
+                        if tipo_img.endswith('/image'):
+                            extension = posixpath.splitext(ruta_img)[1][1:].lower()
+                            imagenes.append({
+                                'hoja': hoja.get('name'),
+                                'formato': _FORMATOS_IMAGEN.get(extension, extension) or 'desconocido'
+                            })
 
         return {
             'tiene_imagenes': len(imagenes) > 0,
@@ -66,29 +129,42 @@ def detectar_imagenes_xlsx(filepath):
         }
 
 
-def extraer_propuestas_xlsx(filepath):
+def extraer_propuestas_xlsx(filepath, wb=None):
     """
     Extrae propuestas de solventación de todas las hojas del archivo Excel.
     Ignora la primera aparición de "PROPUESTA DE SOLVENTACIÓN" y usa numeración global.
 
     Args:
         filepath (str): Ruta del archivo XLSX.
+        wb (Workbook, opcional): Libro ya abierto; si no se indica se abre en modo solo lectura.
 
     Returns:
         list[dict]: Lista de propuestas extraídas con numeración global.
     """
+    # Solo se cierra aquí el libro que se abra aquí
+    cerrar_libro = wb is None
     try:
-        excel_data = pd.ExcelFile(filepath)
+        if wb is None:
+            wb = load_workbook(filepath, read_only=True, data_only=True)
+
         datos_excel = []
         numero_global = 1
 
-        for sheet_name in excel_data.sheet_names:
-            df = excel_data.parse(sheet_name)
+        for sheet in wb.worksheets:
+            sheet_name = sheet.title
             primera_aparicion = True
+            encabezado_pendiente = True
+
+            # Tuplas de valores en streaming, sin construir DataFrames
+            for row in sheet.iter_rows(values_only=True):
+                # La primera fila con datos es el encabezado de la tabla
+                if encabezado_pendiente:
+                    if any(valor is not None for valor in row):
+                        encabezado_pendiente = False
+                    continue
 
-            for i, row in df.iterrows():
                 for idx in range(len(row) - 1):
-                    cell_value = row.iloc[idx]
+                    cell_value = row[idx]
 
                     if isinstance(cell_value, str) and "PROPUESTA DE SOLVENTACIÓN" in cell_value:
                         # Ignorar la primera aparición
@@ -99,14 +175,14 @@ def extraer_propuestas_xlsx(filepath):
                         # Buscar observación (asumiendo que puede estar en columnas anteriores)
                         observacion = None
                         for obs_idx in range(max(0, idx - 2), idx):
-                            obs_cell = row.iloc[obs_idx]
+                            obs_cell = row[obs_idx]
                             if isinstance(obs_cell, str) and "OBSERVACIÓN" in obs_cell:
                                 if obs_idx + 1 < len(row):
-                                    observacion = row.iloc[obs_idx + 1]
+                                    observacion = row[obs_idx + 1]
                                 break
 
                         # Obtener la propuesta (celda a la derecha)
-                        propuesta = row.iloc[idx + 1] if idx + 1 < len(row) else None
+                        propuesta = row[idx + 1] if idx + 1 < len(row) else None
                         propuesta_html = convertir_a_html_crudo(propuesta)
 
                         datos_excel.append({
@@ -123,19 +199,27 @@ def extraer_propuestas_xlsx(filepath):
     except Exception as e:
         raise Exception(f"Error al extraer propuestas: {str(e)}")
 
+    finally:
+        if cerrar_libro and wb is not None:
+            wb.close()
+
 
-def extraer_metadatos_xlsx(filepath):
+def extraer_metadatos_xlsx(filepath, wb=None):
     """
     Extrae metadatos del archivo XLSX.
 
     Args:
         filepath (str): Ruta del archivo XLSX.
+        wb (Workbook, opcional): Libro ya abierto; si no se indica se abre en modo solo lectura.
 
     Returns:
         dict: Metadatos del archivo.
     """
+    # Solo se cierra aquí el libro que se abra aquí
+    cerrar_libro = wb is None
     try:
-        wb = load_workbook(filepath)
+        if wb is None:
+            wb = load_workbook(filepath, read_only=True, data_only=True)
         props = wb.properties
 
         # Obtener nombres de hojas
@@ -167,6 +251,10 @@ def extraer_metadatos_xlsx(filepath):
             'tamano_archivo': os.path.getsize(filepath)
         }
 
+    finally:
+        if cerrar_libro and wb is not None:
+            wb.close()
+
 
 def calcular_estadisticas_xlsx(filepath, propuestas):
     """
@@ -180,31 +268,32 @@ def calcular_estadisticas_xlsx(filepath, propuestas):
         dict: Estadísticas del archivo.
     """
     try:
-        excel_data = pd.ExcelFile(filepath)
-
         total_celdas_con_datos = 0
         total_formulas = 0
         total_filas = 0
         total_columnas = 0
 
-        wb = load_workbook(filepath)
-
-        for sheet_name in wb.sheetnames:
-            sheet = wb[sheet_name]
-
-            # Contar filas y columnas
-            total_filas += sheet.max_row
-            total_columnas += sheet.max_column
-
-            # Contar celdas con datos y fórmulas
-            for row in sheet.iter_rows():
-                for cell in row:
-                    if cell.value is not None:
+        # Sin data_only para conservar las fórmulas; en streaming
+        wb = load_workbook(filepath, read_only=True)
+        try:
+            for sheet in wb.worksheets:
+                # Contar filas y columnas
+                total_filas += sheet.max_row or 0
+                total_columnas += sheet.max_column or 0
+
+                # Contar celdas con datos y fórmulas
+                for row in sheet.iter_rows():
+                    for cell in row:
+                        if cell.value is None:
+                            continue
                         total_celdas_con_datos += 1
 
                         # Verificar si es una fórmula
-                        if isinstance(cell.value, str) and cell.value.startswith('='):
+                        if cell.data_type == 'f':
                             total_formulas += 1
+        finally:
+            # El modo solo lectura mantiene abierto el zip hasta cerrar el libro
+            wb.close()
 
         return {
             'total_hojas': len(wb.sheetnames),
@@ -233,11 +322,17 @@ def process_xlsx(filepath):
         dict: Información extraída del archivo.
     """
     try:
-        # Extraer propuestas de solventación
-        propuestas = extraer_propuestas_xlsx(filepath)
-
-        # Extraer metadatos
-        metadatos = extraer_metadatos_xlsx(filepath)
+        # Un solo libro en modo solo lectura para propuestas y metadatos:
+        # las hojas se recorren en streaming como tuplas de valores
+        wb = load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            # Extraer propuestas de solventación
+            propuestas = extraer_propuestas_xlsx(filepath, wb)
+
+            # Extraer metadatos
+            metadatos = extraer_metadatos_xlsx(filepath, wb)
+        finally:
+            wb.close()
 
         # Calcular estadísticas
         estadisticas = calcular_estadisticas_xlsx(filepath, propuestas)
@@ -6,16 +6,66 @@ Fallback a OpenAI solo cuando la extracción estructurada falla
 
 import os
 import io
-import base64
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Any, Optional, Tuple
-import pandas as pd
 from html import escape
 from openpyxl import load_workbook
 from openpyxl.drawing.image import Image as OpenpyxlImage
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, PatternFill, Border, Alignment
 import re
+from processors.respuesta_openai import parsear_respuesta_json
+
+# Codificador base64: pybase64 (SIMD, codifica y decodifica a str en un paso)
+# si está instalado, la biblioteca estándar si no
+try:
+    from pybase64 import b64encode_as_string as _base64_texto
+except ImportError:
+    from base64 import b64encode as _b64encode
+
+    def _base64_texto(datos: bytes) -> str:
+        return _b64encode(datos).decode('ascii')
+
+# Fechas en varios formatos (extraer_informacion_adicional): una sola alternancia,
+# el texto se recorre una vez y las fechas salen en orden de aparición
+_FECHA_RE = re.compile('|'.join(f'(?:{patron})' for patron in (
+    r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b',
+    r'\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b',
+    r'\b(?:enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s+(?:de\s+)?\d{4}\b',
+    r'\b(?:ene|feb|mar|abr|may|jun|jul|ago|sep|oct|nov|dic)[a-z]*\.?\s+\d{4}\b'
+)), re.IGNORECASE)
+
+# Referencias numéricas (extraer_informacion_adicional)
+_REFERENCIA_RE = re.compile(r'\b(?:ref|referencia|no|número|num)\.?\s*:?\s*(\d+(?:[/-]\d+)*)\b', re.IGNORECASE)
+
+# Número de referencia o clasificación en la primera celda de la fila
+_NUMERO_REFERENCIA_RE = re.compile(r'^\d+(\.\d+)*$')
+_CLASIFICACION_RE = re.compile(r'^[A-Z\d\-_/]+$')
+
+# Llamadas simultáneas a OpenAI en el fallback (una por hoja)
+_MAX_LLAMADAS_OPENAI = 4
+
+# Palabras clave buscadas en extraer_informacion_adicional (ya en minúsculas)
+_PALABRAS_RESPONSABLE = ('responsable:', 'encargado:', 'titular:', 'director:', 'coordinador:', 'jefe:')
+_PALABRAS_IMPORTANTES = ('cumplimiento', 'incumplimiento', 'pendiente', 'realizado', 'en proceso',
+                         'evidencia', 'documentación', 'plazo', 'vencimiento', 'urgente', 'prioritario')
+
+
+# Pocos colores distintos por libro: se memoriza la conversión
+@lru_cache(maxsize=256)
+def _color_css(color: str) -> Optional[str]:
+    """Convierte un color ARGB/RGB de openpyxl a '#RRGGBB' (None si no es válido)"""
+    if not color.startswith('#'):
+        # Remover los primeros 2 caracteres si son FF (alpha channel)
+        if len(color) > 6 and color[:2].upper() == 'FF':
+            color = color[2:]
+        color = f"#{color}"
+    if len(color) == 7 or len(color) == 9:
+        return color
+    return None
 
 
 class XLSXProcessorOptimized:
@@ -24,6 +74,10 @@ class XLSXProcessorOptimized:
     def __init__(self):
         self.use_openai_fallback = False
         self.openai_client = None
+        # Estilos ya extraídos por libro: {workbook: {style_id: estilo}}
+        self._cache_estilos = weakref.WeakKeyDictionary()
+        # Plantillas HTML por libro: {workbook: {style_id: (apertura, cierre)}}
+        self._cache_plantillas = weakref.WeakKeyDictionary()
 
     def _init_openai(self):
         """Inicializa cliente OpenAI solo si es necesario"""
@@ -43,51 +97,66 @@ class XLSXProcessorOptimized:
                 self.use_openai_fallback = False
 
     def extraer_estilo_celda(self, cell) -> Dict[str, Any]:
-        """Extrae información de estilo de una celda"""
+        """
+        Extrae información de estilo de una celda
+        Las celdas con el mismo estilo comparten resultado (el dict devuelto es de solo lectura)
+        """
+        try:
+            estilos_libro = self._cache_estilos.setdefault(cell.parent.parent, {})
+            style_id = cell.style_id
+        except Exception:
+            return self._calcular_estilo_celda(cell)
+
+        estilo = estilos_libro.get(style_id)
+        if estilo is None:
+            estilo = estilos_libro[style_id] = self._calcular_estilo_celda(cell)
+        return estilo
+
+    def _calcular_estilo_celda(self, cell) -> Dict[str, Any]:
+        """Recorre fuente, relleno, alineación, bordes y formato de una celda"""
         estilo = {}
 
         try:
+            # Cada propiedad de estilo se resuelve una sola vez
+            font = cell.font
+            fill = cell.fill
+            alignment = cell.alignment
+
             # Fuente
-            if cell.font:
+            if font:
                 # Extraer color de fuente correctamente
-                color_fuente = None
-                try:
-                    if cell.font.color and hasattr(cell.font.color, 'rgb'):
-                        color_value = cell.font.color.rgb
-                        if isinstance(color_value, str):
-                            color_fuente = color_value.strip()
-                        else:
-                            color_fuente = str(color_value)
-                except Exception:
-                    pass
+                color_value = getattr(font.color, 'rgb', None)
+                if color_value is None:
+                    color_fuente = None
+                elif isinstance(color_value, str):
+                    color_fuente = color_value.strip()
+                else:
+                    color_fuente = str(color_value)
 
                 estilo['fuente'] = {
-                    'nombre': cell.font.name,
-                    'tamaño': cell.font.size,
-                    'negrita': cell.font.bold,
-                    'cursiva': cell.font.italic,
-                    'subrayado': cell.font.underline is not None,
+                    'nombre': font.name,
+                    'tamaño': font.size,
+                    'negrita': font.bold,
+                    'cursiva': font.italic,
+                    'subrayado': font.underline is not None,
                     'color': color_fuente
                 }
 
             # Relleno
-            if cell.fill and cell.fill.start_color:
-                try:
-                    if hasattr(cell.fill.start_color, 'rgb'):
-                        relleno_value = cell.fill.start_color.rgb
-                        if isinstance(relleno_value, str):
-                            estilo['relleno'] = relleno_value.strip()
-                        else:
-                            estilo['relleno'] = str(relleno_value)
-                except Exception:
-                    pass
+            start_color = fill.start_color if fill else None
+            if start_color:
+                relleno_value = getattr(start_color, 'rgb', None)
+                if isinstance(relleno_value, str):
+                    estilo['relleno'] = relleno_value.strip()
+                elif relleno_value is not None:
+                    estilo['relleno'] = str(relleno_value)
 
             # Alineación
-            if cell.alignment:
+            if alignment:
                 estilo['alineacion'] = {
-                    'horizontal': cell.alignment.horizontal,
-                    'vertical': cell.alignment.vertical,
-                    'ajustar_texto': cell.alignment.wrap_text
+                    'horizontal': alignment.horizontal,
+                    'vertical': alignment.vertical,
+                    'ajustar_texto': alignment.wrap_text
                 }
 
             # Bordes
@@ -109,42 +178,52 @@ class XLSXProcessorOptimized:
         if value is None or value == '':
             return ''
 
-        texto = escape(str(value))
-        estilo = self.extraer_estilo_celda(cell)
+        apertura, cierre = self._plantilla_html_celda(cell)
+        # Números y fechas nunca contienen &, <, >, comillas: solo el texto se escapa
+        texto = escape(value) if isinstance(value, str) else str(value)
+        return f"{apertura}{texto}{cierre}"
 
+    def _plantilla_html_celda(self, cell) -> Tuple[str, str]:
+        """
+        Etiquetas de apertura y cierre que envuelven el texto de la celda.
+        Solo dependen del estilo: se calculan una vez por style_id y libro, de modo que
+        las celdas con el estilo por defecto (la mayoría) comparten una sola entrada
+        """
+        try:
+            plantillas_libro = self._cache_plantillas.setdefault(cell.parent.parent, {})
+            style_id = cell.style_id
+        except Exception:
+            return self._construir_plantilla_html(self.extraer_estilo_celda(cell))
+
+        plantilla = plantillas_libro.get(style_id)
+        if plantilla is None:
+            plantilla = plantillas_libro[style_id] = self._construir_plantilla_html(self.extraer_estilo_celda(cell))
+        return plantilla
+
+    def _construir_plantilla_html(self, estilo: Dict[str, Any]) -> Tuple[str, str]:
+        """Traduce un estilo extraído a <span style=...> y etiquetas de formato"""
         # Construir estilos CSS
         css_styles = ['text-align:left']
+        etiquetas = []
 
         if 'fuente' in estilo:
             fuente = estilo['fuente']
             if fuente.get('negrita'):
-                texto = f"<b>{texto}</b>"
+                etiquetas.append('b')
             if fuente.get('cursiva'):
-                texto = f"<i>{texto}</i>"
+                etiquetas.append('i')
             if fuente.get('subrayado'):
-                texto = f"<u>{texto}</u>"
+                etiquetas.append('u')
             if fuente.get('tamaño'):
                 css_styles.append(f"font-size:{fuente['tamaño']}pt")
             if fuente.get('color'):
-                # Formatear color correctamente
-                color = fuente['color']
-                if not color.startswith('#'):
-                    # Remover los primeros 2 caracteres si son FF (alpha channel)
-                    if len(color) > 6 and color[:2].upper() == 'FF':
-                        color = color[2:]
-                    color = f"#{color}"
-                if len(color) == 7 or len(color) == 9:
+                color = _color_css(fuente['color'])
+                if color:
                     css_styles.append(f"color:{color}")
 
         if 'relleno' in estilo and estilo['relleno']:
-            # Formatear color de relleno correctamente
-            relleno = estilo['relleno']
-            if not relleno.startswith('#'):
-                # Remover los primeros 2 caracteres si son FF (alpha channel)
-                if len(relleno) > 6 and relleno[:2].upper() == 'FF':
-                    relleno = relleno[2:]
-                relleno = f"#{relleno}"
-            if len(relleno) == 7 or len(relleno) == 9:
+            relleno = _color_css(estilo['relleno'])
+            if relleno:
                 css_styles.append(f"background-color:{relleno}")
 
         if 'alineacion' in estilo:
@@ -154,51 +233,115 @@ class XLSXProcessorOptimized:
             if alin.get('ajustar_texto'):
                 css_styles.append('white-space:pre-wrap')
 
+        # Las etiquetas se anidan en orden: <u><i><b>texto</b></i></u>
         style_attr = '; '.join(css_styles)
-        return f"<span style='{style_attr}'>{texto}</span>"
+        apertura = f"<span style='{style_attr}'>" + ''.join(f"<{etiqueta}>" for etiqueta in reversed(etiquetas))
+        cierre = ''.join(f"</{etiqueta}>" for etiqueta in etiquetas) + "</span>"
+        return apertura, cierre
+
+    def _mapa_celdas_fusionadas(self, sheet) -> Tuple[Dict[Tuple[int, int], str], set]:
+        """
+        Recorre una sola vez los rangos fusionados de la hoja.
+        Devuelve los atributos rowspan/colspan de cada celda ancla y el conjunto
+        de celdas ocultas por la fusión, ambos indexados por (fila, columna).
+        """
+        anclas = {}
+        ocultas = set()
+
+        for merged_range in sheet.merged_cells.ranges:
+            rows_span = merged_range.max_row - merged_range.min_row + 1
+            cols_span = merged_range.max_col - merged_range.min_col + 1
+            rowspan_attr = f" rowspan='{rows_span}'" if rows_span > 1 else ""
+            colspan_attr = f" colspan='{cols_span}'" if cols_span > 1 else ""
+            ancla = (merged_range.min_row, merged_range.min_col)
+
+            for fila in range(merged_range.min_row, merged_range.max_row + 1):
+                for columna in range(merged_range.min_col, merged_range.max_col + 1):
+                    coordenada = (fila, columna)
+                    # Si los rangos se solapan, prevalece el primero (como en el recorrido original)
+                    if coordenada in anclas or coordenada in ocultas:
+                        continue
+                    if coordenada == ancla:
+                        anclas[coordenada] = f"{rowspan_attr}{colspan_attr}"
+                    else:
+                        ocultas.add(coordenada)
+
+        return anclas, ocultas
 
     def extraer_tabla_completa_hoja(self, sheet) -> str:
         """Extrae una hoja completa como tabla HTML con todos los estilos"""
-        html = "<table border='1' style='border-collapse: collapse; width:100%;'>\n"
+        # Fragmentos en lista y un solo join al final (evita concatenaciones cuadráticas)
+        partes = ["<table border='1' style='border-collapse: collapse; width:100%;'>\n"]
+        agregar = partes.append
+
+        # Celdas fusionadas precalculadas: una búsqueda en dict por celda
+        anclas, ocultas = self._mapa_celdas_fusionadas(sheet)
 
-        # Procesar cada fila
-        for row_idx, row in enumerate(sheet.iter_rows(), start=1):
-            html += "<tr>\n"
+        # Procesar cada fila, solo hasta la última fila/columna con contenido
+        max_fila, max_columna = self._limites_con_contenido(sheet)
+        for row in sheet.iter_rows(max_row=max_fila, max_col=max_columna):
+            agregar("<tr>\n")
 
             for cell in row:
-                # Obtener valor
+                coordenada = (cell.row, cell.column)
+
+                # Celda oculta por fusión: el ancla ya la cubre
+                if coordenada in ocultas:
+                    continue
+
+                # Solo la primera celda del rango fusionado lleva rowspan/colspan
+                atributos = anclas.get(coordenada, "")
+
+                # Celda vacía (lo más común en plantillas dispersas): sin trabajo de estilos
                 value = cell.value
+                if value is None or value == '':
+                    agregar(f"<td{atributos}></td>\n")
+                    continue
 
                 # Convertir a HTML con estilos
                 contenido_html = self.celda_a_html(cell, value)
+                agregar(f"<td{atributos}>{contenido_html}</td>\n")
+
+            agregar("</tr>\n")
 
-                # Verificar si es celda fusionada
-                es_fusionada = False
-                for merged_range in sheet.merged_cells.ranges:
-                    if cell.coordinate in merged_range:
-                        # Solo mostrar contenido en la primera celda del rango fusionado
-                        if cell.coordinate == merged_range.start_cell.coordinate:
-                            rows_span = merged_range.max_row - merged_range.min_row + 1
-                            cols_span = merged_range.max_col - merged_range.min_col + 1
-                            rowspan_attr = f" rowspan='{rows_span}'" if rows_span > 1 else ""
-                            colspan_attr = f" colspan='{cols_span}'" if cols_span > 1 else ""
-                            html += f"<td{rowspan_attr}{colspan_attr}>{contenido_html}</td>\n"
-                            es_fusionada = True
-                        else:
-                            # Celda oculta por fusión
-                            es_fusionada = True
-                        break
-
-                if not es_fusionada:
-                    html += f"<td>{contenido_html}</td>\n"
-
-            html += "</tr>\n"
-
-        html += "</table>"
-        return html
-
-    def extraer_imagenes_hoja(self, sheet) -> List[Dict[str, Any]]:
-        """Extrae todas las imágenes de una hoja con sus datos binarios"""
+        agregar("</table>")
+        return ''.join(partes)
+
+    def _limites_con_contenido(self, sheet) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Última fila y columna con valor o cubiertas por un rango fusionado.
+        max_row/max_column también cuentan celdas con solo formato (bordes, rellenos
+        de plantilla), que se emitirían como filas y columnas de <td> vacíos.
+        Devuelve (None, None) si no se puede determinar: se usa el rango completo
+        """
+        celdas = getattr(sheet, '_cells', None)
+        if not celdas:
+            return None, None
+
+        max_fila = max_columna = 0
+        for (fila, columna), celda in celdas.items():
+            valor = celda.value
+            if valor is None or valor == '':
+                continue
+            if fila > max_fila:
+                max_fila = fila
+            if columna > max_columna:
+                max_columna = columna
+
+        for merged_range in sheet.merged_cells.ranges:
+            max_fila = max(max_fila, merged_range.max_row)
+            max_columna = max(max_columna, merged_range.max_col)
+
+        if not max_fila:
+            return None, None
+        return max_fila, max_columna
+
+    def extraer_imagenes_hoja(self, sheet, incluir_base64: bool = True) -> List[Dict[str, Any]]:
+        """
+        Extrae todas las imágenes de una hoja con sus datos binarios
+        Con incluir_base64=False solo devuelve los metadatos (sin codificar los datos);
+        obtener_imagen_base64 los codifica bajo demanda
+        """
         imagenes = []
 
         try:
@@ -226,7 +369,8 @@ class XLSXProcessorOptimized:
                     try:
                         if hasattr(img, '_data'):
                             imagen_bytes = img._data()
-                            imagen_data['datos_base64'] = base64.b64encode(imagen_bytes).decode('utf-8')
+                            if incluir_base64:
+                                imagen_data['datos_base64'] = _base64_texto(imagen_bytes)
                             imagen_data['tamaño_bytes'] = len(imagen_bytes)
                     except Exception as e:
                         imagen_data['error_extraccion'] = str(e)
@@ -238,6 +382,17 @@ class XLSXProcessorOptimized:
 
         return imagenes
 
+    def obtener_imagen_base64(self, filepath: str, nombre_hoja: str, indice: int) -> str:
+        """
+        Codifica en base64 una imagen concreta (indice empieza en 1, como en extraer_imagenes_hoja)
+        Lanza KeyError si la hoja no existe e IndexError si no hay imagen con ese índice
+        """
+        wb = load_workbook(filepath)
+        imagenes = getattr(wb[nombre_hoja], '_images', [])
+        if not 1 <= indice <= len(imagenes):
+            raise IndexError(f"La hoja '{nombre_hoja}' no tiene imagen {indice}")
+        return _base64_texto(imagenes[indice - 1]._data())
+
     def extraer_informacion_adicional(self, texto: str) -> Dict[str, Any]:
         """
         Extrae información adicional del texto de propuestas y observaciones
@@ -250,68 +405,60 @@ class XLSXProcessorOptimized:
         }
 
         # Buscar fechas (varios formatos)
-        patrones_fecha = [
-            r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b',
-            r'\b\d{4}[/-]\d{1,2}[/-]\d{1,2}\b',
-            r'\b(?:enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|octubre|noviembre|diciembre)\s+(?:de\s+)?\d{4}\b',
-            r'\b(?:ene|feb|mar|abr|may|jun|jul|ago|sep|oct|nov|dic)[a-z]*\.?\s+\d{4}\b'
-        ]
+        info['fechas'].extend(_FECHA_RE.findall(texto))
 
-        for patron in patrones_fecha:
-            fechas_encontradas = re.findall(patron, texto, re.IGNORECASE)
-            info['fechas'].extend(fechas_encontradas)
+        # Minúsculas una sola vez para todas las búsquedas por palabra clave
+        texto_lower = texto.lower()
 
         # Buscar responsables
-        palabras_responsable = ['responsable:', 'encargado:', 'titular:', 'director:', 'coordinador:', 'jefe:']
-        for palabra in palabras_responsable:
-            if palabra in texto.lower():
-                inicio = texto.lower().find(palabra)
+        for palabra in _PALABRAS_RESPONSABLE:
+            inicio = texto_lower.find(palabra)
+            if inicio != -1:
                 fragmento = texto[inicio:inicio+100]
                 info['responsables'].append(fragmento)
 
         # Buscar referencias numéricas
-        referencias = re.findall(r'\b(?:ref|referencia|no|número|num)\.?\s*:?\s*(\d+(?:[/-]\d+)*)\b', texto, re.IGNORECASE)
+        referencias = _REFERENCIA_RE.findall(texto)
         info['referencias'].extend(referencias)
 
         # Palabras clave importantes
-        palabras_importantes = ['cumplimiento', 'incumplimiento', 'pendiente', 'realizado', 'en proceso',
-                                'evidencia', 'documentación', 'plazo', 'vencimiento', 'urgente', 'prioritario']
-        for palabra in palabras_importantes:
-            if palabra in texto.lower():
-                info['palabras_clave'].append(palabra)
+        info['palabras_clave'].extend(palabra for palabra in _PALABRAS_IMPORTANTES if palabra in texto_lower)
 
         return info
 
-    def extraer_propuestas_estructuradas(self, filepath: str) -> List[Dict[str, Any]]:
+    def extraer_propuestas_estructuradas(self, filepath: str, wb=None) -> List[Dict[str, Any]]:
         """
         Extrae propuestas usando lógica estructurada (método mejorado con información adicional)
+        Reutiliza el libro ya abierto por process_xlsx si se proporciona
         """
         try:
-            excel_data = pd.ExcelFile(filepath)
-            wb = load_workbook(filepath)
+            if wb is None:
+                wb = load_workbook(filepath, data_only=True)
             propuestas = []
             numero_global = 1
 
-            for sheet_name in excel_data.sheet_names:
-                df = excel_data.parse(sheet_name)
-                sheet = wb[sheet_name]
+            for sheet in wb.worksheets:
+                sheet_name = sheet.title
 
-                # Buscar todas las apariciones de "PROPUESTA DE SOLVENTACIÓN"
-                for i, row in df.iterrows():
+                # Recorrer las filas una sola vez (la fila 1 es el encabezado; i + 2 es la
+                # fila real de la hoja). Se conservan las celdas para dar estilo al HTML
+                # sin volver a indexar la hoja con sheet.cell()
+                for i, celdas in enumerate(sheet.iter_rows(min_row=2)):
+                    row = [celda.value for celda in celdas]
                     for idx in range(len(row) - 1):
-                        cell_value = row.iloc[idx]
+                        cell_value = row[idx]
 
                         if isinstance(cell_value, str) and "PROPUESTA DE SOLVENTACIÓN" in cell_value.upper():
                             # Buscar número de referencia o clasificación al inicio
                             numero_referencia = None
                             clasificacion = None
                             if idx > 0:
-                                primera_celda = row.iloc[0]
-                                if primera_celda and str(primera_celda).strip():
-                                    primer_valor = str(primera_celda).strip()
-                                    if re.match(r'^\d+(\.\d+)*$', primer_valor):
+                                primera_celda = row[0]
+                                primer_valor = str(primera_celda).strip() if primera_celda else ""
+                                if primer_valor:
+                                    if _NUMERO_REFERENCIA_RE.match(primer_valor):
                                         numero_referencia = primer_valor
-                                    elif re.match(r'^[A-Z\d\-_/]+$', primer_valor):
+                                    elif _CLASIFICACION_RE.match(primer_valor):
                                         clasificacion = primer_valor
 
                             # Buscar observación
@@ -319,15 +466,15 @@ class XLSXProcessorOptimized:
                             observacion_html = None
 
                             for obs_idx in range(max(0, idx - 3), idx + 1):
-                                obs_cell = row.iloc[obs_idx] if obs_idx < len(row) else None
+                                obs_cell = row[obs_idx] if obs_idx < len(row) else None
                                 if obs_cell and isinstance(obs_cell, str) and "OBSERVACIÓN" in obs_cell.upper():
                                     if obs_idx + 1 < len(row):
-                                        obs_value = row.iloc[obs_idx + 1]
+                                        obs_value = row[obs_idx + 1]
                                         observacion = self._limpiar_texto(obs_value)
 
                                         # Obtener celda original para HTML con estilo
                                         try:
-                                            cell_obs = sheet.cell(row=i+2, column=obs_idx+2)
+                                            cell_obs = celdas[obs_idx + 1]
                                             observacion_html = self.celda_a_html(cell_obs, obs_value)
                                         except:
                                             observacion_html = f"<p>{escape(str(obs_value))}</p>"
@@ -338,12 +485,12 @@ class XLSXProcessorOptimized:
                             propuesta_html = None
 
                             if idx + 1 < len(row):
-                                prop_value = row.iloc[idx + 1]
+                                prop_value = row[idx + 1]
                                 propuesta = self._limpiar_texto(prop_value)
 
                                 # Obtener celda original para HTML con estilo
                                 try:
-                                    cell_prop = sheet.cell(row=i+2, column=idx+2)
+                                    cell_prop = celdas[idx + 1]
                                     propuesta_html = self.celda_a_html(cell_prop, prop_value)
                                 except:
                                     propuesta_html = f"<p>{escape(str(prop_value))}</p>"
@@ -430,20 +577,13 @@ IMPORTANTE: Solo devuelve el JSON, sin texto adicional."""
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.1,
-                max_tokens=2000
+                max_tokens=2000,
+                # Modo JSON: la respuesta llega como objeto JSON, sin bloque markdown
+                response_format={"type": "json_object"}
             )
 
-            # Parsear respuesta
-            import json
-            respuesta_texto = response.choices[0].message.content.strip()
-
-            # Limpiar markdown si existe
-            if respuesta_texto.startswith('```'):
-                respuesta_texto = respuesta_texto.split('```')[1]
-                if respuesta_texto.startswith('json'):
-                    respuesta_texto = respuesta_texto[4:]
-
-            resultado = json.loads(respuesta_texto)
+            # Parsear respuesta (con o sin bloque markdown ```json ... ```)
+            resultado = parsear_respuesta_json(response.choices[0].message.content)
 
             # Formatear propuestas
             propuestas = []
@@ -471,13 +611,14 @@ IMPORTANTE: Solo devuelve el JSON, sin texto adicional."""
         if not isinstance(texto, str):
             texto = str(texto)
         # Eliminar espacios múltiples y saltos de línea excesivos
-        texto = re.sub(r'\s+', ' ', texto).strip()
-        return texto
+        # (split() sin argumentos corta por los mismos espacios que \s)
+        return ' '.join(texto.split())
 
-    def extraer_metadatos(self, filepath: str) -> Dict[str, Any]:
-        """Extrae metadatos completos del archivo XLSX"""
+    def extraer_metadatos(self, filepath: str, wb=None) -> Dict[str, Any]:
+        """Extrae metadatos completos del archivo XLSX (reutiliza el libro si ya está abierto)"""
         try:
-            wb = load_workbook(filepath)
+            if wb is None:
+                wb = load_workbook(filepath)
             props = wb.properties
 
             # Obtener información de hojas
@@ -488,7 +629,7 @@ IMPORTANTE: Solo devuelve el JSON, sin texto adicional."""
                     'nombre': sheet_name,
                     'filas': sheet.max_row,
                     'columnas': sheet.max_column,
-                    'celdas_activas': sum(1 for row in sheet.iter_rows() for cell in row if cell.value is not None)
+                    'celdas_activas': self._contar_celdas_activas(sheet)
                 })
 
             return {
@@ -507,22 +648,43 @@ IMPORTANTE: Solo devuelve el JSON, sin texto adicional."""
             }
 
         except Exception as e:
+            # Un solo stat: si el archivo no existe, getsize falla igual que exists
+            try:
+                tamano_archivo = os.path.getsize(filepath)
+            except OSError:
+                tamano_archivo = 0
             return {
                 'nombre_archivo': os.path.basename(filepath),
                 'error_metadatos': str(e),
-                'tamano_archivo': os.path.getsize(filepath) if os.path.exists(filepath) else 0
+                'tamano_archivo': tamano_archivo
             }
 
-    def process_xlsx(self, filepath: str) -> Dict[str, Any]:
+    def _contar_celdas_activas(self, sheet) -> int:
+        """
+        Cuenta las celdas con valor de una hoja.
+        Recorre solo las celdas almacenadas: iter_rows() crearía una celda vacía
+        por cada hueco del rango usado
+        """
+        celdas = getattr(sheet, '_cells', None)
+        if celdas is not None:
+            return sum(1 for celda in celdas.values() if celda.value is not None)
+        # Hojas de solo lectura: tuplas de valores en streaming
+        return sum(1 for fila in sheet.iter_rows(values_only=True) for valor in fila if valor is not None)
+
+    def process_xlsx(self, filepath: str, incluir_base64: bool = True) -> Dict[str, Any]:
         """
         Procesa un archivo XLSX de manera optimizada
         Extrae TODO el contenido fielmente y usa OpenAI solo como fallback
+        Con incluir_base64=False las imágenes se reportan sin sus datos codificados
         """
         try:
-            wb = load_workbook(filepath)
+            # Un solo libro para todo el procesamiento. Se necesita el modo completo
+            # (estilos, celdas fusionadas e imágenes no existen en read_only);
+            # data_only muestra los valores calculados, igual que la lectura de pandas.
+            wb = load_workbook(filepath, data_only=True)
 
             # 1. Extraer metadatos
-            metadatos = self.extraer_metadatos(filepath)
+            metadatos = self.extraer_metadatos(filepath, wb)
 
             # 2. Extraer contenido completo de cada hoja
             hojas_completas = []
@@ -536,7 +698,7 @@ IMPORTANTE: Solo devuelve el JSON, sin texto adicional."""
                 tabla_html = self.extraer_tabla_completa_hoja(sheet)
 
                 # Extraer imágenes de la hoja
-                imagenes = self.extraer_imagenes_hoja(sheet)
+                imagenes = self.extraer_imagenes_hoja(sheet, incluir_base64)
                 total_imagenes += len(imagenes)
 
                 hojas_completas.append({
@@ -550,20 +712,21 @@ IMPORTANTE: Solo devuelve el JSON, sin texto adicional."""
             # 3. Intentar extracción estructurada de propuestas
             propuestas = []
             try:
-                propuestas = self.extraer_propuestas_estructuradas(filepath)
+                propuestas = self.extraer_propuestas_estructuradas(filepath, wb)
             except Exception as e:
                 print(f"Extracción estructurada falló: {e}")
 
             # 4. Si no se encontraron propuestas, intentar con OpenAI (fallback)
             if len(propuestas) == 0 and self.use_openai_fallback:
                 print("Usando OpenAI como fallback...")
-                for hoja in hojas_completas:
-                    propuestas_openai = self.extraer_con_openai(
-                        filepath,
-                        hoja['contenido_html'],
-                        hoja['nombre']
+                # Una llamada por hoja; son de red, se solapan en hilos (map conserva el orden)
+                with ThreadPoolExecutor(max_workers=min(_MAX_LLAMADAS_OPENAI, len(hojas_completas) or 1)) as executor:
+                    resultados_openai = executor.map(
+                        lambda hoja: self.extraer_con_openai(filepath, hoja['contenido_html'], hoja['nombre']),
+                        hojas_completas
                     )
-                    propuestas.extend(propuestas_openai)
+                    for propuestas_openai in resultados_openai:
+                        propuestas.extend(propuestas_openai)
 
             # 5. Calcular estadísticas
             estadisticas = {
@@ -602,6 +765,11 @@ IMPORTANTE: Solo devuelve el JSON, sin texto adicional."""
 processor = XLSXProcessorOptimized()
 
 
-def process_xlsx(filepath: str) -> Dict[str, Any]:
+def process_xlsx(filepath: str, incluir_base64: bool = True) -> Dict[str, Any]:
     """Función de compatibilidad con el código existente"""
-    return processor.process_xlsx(filepath)
+    return processor.process_xlsx(filepath, incluir_base64)
+
+
+def obtener_imagen_base64(filepath: str, nombre_hoja: str, indice: int) -> str:
+    """Codifica bajo demanda una imagen de una hoja"""
+    return processor.obtener_imagen_base64(filepath, nombre_hoja, indice)
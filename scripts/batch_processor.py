@@ -8,14 +8,18 @@ import os
 import sys
 import json
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 from tqdm import tqdm
 
 # Importar procesadores
 from processors.docx_processor_optimized import process_docx
 from processors.xlsx_processor_optimized import process_xlsx
+from processors.json_rapido import guardar_json
 
 # Importar módulos propios
 from scripts.metadata_analyzer import analizar_archivo
@@ -28,21 +32,47 @@ from scripts.database_consolidator import (
 )
 
 
+def _extraer_contenido(ruta_archivo: str) -> Dict:
+    """
+    Extrae el contenido de un archivo según su extensión
+
+    Se ejecuta en procesos trabajadores: solo usa los procesadores de
+    documentos, sin tocar el estado global de consolidación ni de reportes.
+
+    Args:
+        ruta_archivo: Ruta del archivo a procesar
+
+    Returns:
+        Diccionario con el contenido extraído
+    """
+    extension = Path(ruta_archivo).suffix.lower()
+
+    if extension == '.docx':
+        return process_docx(ruta_archivo)
+    elif extension == '.xlsx':
+        return process_xlsx(ruta_archivo)
+    else:
+        raise ValueError(f"Tipo de archivo no soportado: {extension}")
+
+
 class BatchProcessor:
     """
     Procesador por lotes para análisis masivo de documentos
     """
 
-    def __init__(self, carpeta_entrada: str = 'examples', carpeta_salida: str = 'resultados_consolidados'):
+    def __init__(self, carpeta_entrada: str = 'examples', carpeta_salida: str = 'resultados_consolidados',
+                 max_workers: Optional[int] = 1):
         """
         Inicializa el procesador por lotes
 
         Args:
             carpeta_entrada: Carpeta donde se encuentran los archivos a procesar
             carpeta_salida: Carpeta donde se guardarán los resultados
+            max_workers: Procesos para la extracción en paralelo (1 = secuencial, None = núcleos disponibles)
         """
         self.carpeta_entrada = Path(carpeta_entrada)
         self.carpeta_salida = Path(carpeta_salida)
+        self.max_workers = max_workers
         self.carpeta_salida.mkdir(exist_ok=True)
 
         # Configurar logging
@@ -102,12 +132,14 @@ class BatchProcessor:
         self.logger.info(f"Encontrados {len(archivos)} archivos para procesar")
         return sorted(archivos)
 
-    def procesar_archivo(self, ruta_archivo: Path) -> Dict:
+    def procesar_archivo(self, ruta_archivo: Path, contenido_extraido: Optional[Dict] = None) -> Dict:
         """
         Procesa un archivo individual
 
         Args:
             ruta_archivo: Ruta del archivo a procesar
+            contenido_extraido: Contenido ya extraído (p. ej. por un proceso trabajador);
+                si no se indica, se extrae aquí
 
         Returns:
             Diccionario con el resultado del procesamiento
@@ -123,14 +155,8 @@ class BatchProcessor:
 
         try:
             # 1. Extraer contenido según el tipo de archivo
-            extension = ruta_archivo.suffix.lower()
-
-            if extension == '.docx':
-                contenido_extraido = process_docx(str(ruta_archivo))
-            elif extension == '.xlsx':
-                contenido_extraido = process_xlsx(str(ruta_archivo))
-            else:
-                raise ValueError(f"Tipo de archivo no soportado: {extension}")
+            if contenido_extraido is None:
+                contenido_extraido = _extraer_contenido(str(ruta_archivo))
 
             # Verificar si la extracción fue exitosa
             if not contenido_extraido.get('extraccion_exitosa', False):
@@ -184,8 +210,7 @@ class BatchProcessor:
         archivo_salida = self.carpeta_salida / 'individuales' / f'{nombre_base}_resultado.json'
         archivo_salida.parent.mkdir(exist_ok=True)
 
-        with open(archivo_salida, 'w', encoding='utf-8') as f:
-            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        guardar_json(archivo_salida, resultado)
 
     def procesar_todos(self):
         """
@@ -214,9 +239,54 @@ class BatchProcessor:
         print(f"\n📂 Procesando {len(archivos)} archivos...\n")
 
         resultados = []
-        for archivo in tqdm(archivos, desc="Progreso", unit="archivo"):
-            resultado = self.procesar_archivo(archivo)
-            resultados.append(resultado)
+        if self.max_workers == 1:
+            for archivo in tqdm(archivos, desc="Progreso", unit="archivo"):
+                resultado = self.procesar_archivo(archivo)
+                resultados.append(resultado)
+        else:
+            # La extracción (CPU intensiva) corre en paralelo; el análisis y la
+            # consolidación siguen en este proceso y en el orden original.
+            # Como mucho hay 2 extracciones por proceso en curso (los contenidos
+            # no se acumulan en memoria): al recoger una se envía el siguiente archivo
+            workers = self.max_workers or os.cpu_count() or 1
+            ventana = workers * 2
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                restantes = deque(archivos)
+                pendientes = deque()
+                pool_roto = False
+
+                with tqdm(total=len(archivos), desc="Progreso", unit="archivo") as progreso:
+                    while True:
+                        # Completar la ventana de extracciones en curso
+                        while restantes and len(pendientes) < ventana and not pool_roto:
+                            try:
+                                futuro = executor.submit(_extraer_contenido, str(restantes[0]))
+                            except BrokenProcessPool:
+                                # Un proceso trabajador murió: lo que falta se extrae aquí
+                                self.logger.warning("El pool de procesos se interrumpió; "
+                                                    f"{len(restantes)} archivos se procesarán en secuencia")
+                                pool_roto = True
+                            else:
+                                pendientes.append((restantes.popleft(), futuro))
+
+                        if not pendientes:
+                            break
+
+                        archivo, futuro = pendientes.popleft()
+                        try:
+                            contenido_extraido = futuro.result()
+                        except Exception as e:
+                            contenido_extraido = {'extraccion_exitosa': False, 'error': str(e)}
+
+                        resultado = self.procesar_archivo(archivo, contenido_extraido)
+                        resultados.append(resultado)
+                        progreso.update()
+
+                    # Archivos que no llegaron a enviarse al pool
+                    for archivo in restantes:
+                        resultado = self.procesar_archivo(archivo)
+                        resultados.append(resultado)
+                        progreso.update()
 
         # Generar reportes consolidados
         print("\n📊 Generando reportes consolidados...\n")
@@ -318,6 +388,9 @@ Ejemplos de uso:
   # Especificar carpeta de entrada y salida
   python batch_processor.py --entrada ./mis_documentos --salida ./resultados
 
+  # Extraer el contenido en paralelo con 4 procesos
+  python batch_processor.py --workers 4
+
   # Ver ayuda
   python batch_processor.py --help
         """
@@ -337,6 +410,13 @@ Ejemplos de uso:
         help='Carpeta de salida para resultados (default: resultados_consolidados)'
     )
 
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Procesos para la extracción en paralelo (default: 1 = secuencial, 0 = núcleos disponibles)'
+    )
+
     args = parser.parse_args()
 
     # Verificar que la carpeta de entrada existe
@@ -347,7 +427,8 @@ Ejemplos de uso:
     # Crear y ejecutar procesador
     processor = BatchProcessor(
         carpeta_entrada=args.entrada,
-        carpeta_salida=args.salida
+        carpeta_salida=args.salida,
+        max_workers=args.workers or None
     )
 
     try:
@@ -4,13 +4,38 @@ Genera base de datos consolidada en Excel organizada por Ente y Fuente de Financ
 """
 
 import os
+import copy
 from typing import Dict, List, Optional
 from datetime import datetime
 import pandas as pd
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils.dataframe import dataframe_to_rows
-import re
+
+# Estilos compartidos: se crean una sola vez y se reutilizan en todas las hojas y celdas
+_FUENTE_TITULO_ENTE = Font(bold=True, size=16, color="FFFFFF")
+_FUENTE_TITULO = Font(bold=True, size=14, color="FFFFFF")
+_RELLENO_TITULO = PatternFill(start_color="203764", end_color="203764", fill_type="solid")
+_ALINEACION_TITULO = Alignment(horizontal="center", vertical="center")
+
+_FUENTE_ENCABEZADO = Font(bold=True)
+_RELLENO_ENCABEZADO = PatternFill(start_color="D0CECE", end_color="D0CECE", fill_type="solid")
+_ALINEACION_ENCABEZADO = Alignment(horizontal="center", wrap_text=True)
+_ALINEACION_CENTRO = Alignment(horizontal="center")
+
+_FUENTE_SECCION = Font(bold=True, size=12)
+_RELLENO_SECCION = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
+
+
+# Columnas de la base consolidada, en el orden en que se escriben
+_COLUMNAS = (
+    'Ente', 'Fuente de Financiamiento', 'Periodo', 'Tipo Documento', 'Archivo Origen',
+    'Número Propuesta', 'Observación', 'Propuesta de Solventación', 'Hoja', 'Fila',
+    'Fecha Procesamiento'
+)
+
+# Anchos de columna de las hojas por ente: 20 en todas, la propuesta (H) más ancha
+_ANCHOS_HOJA_ENTE = {col: 20 for col in 'ABCDEFGHIJK'}
+_ANCHOS_HOJA_ENTE['H'] = 60
 
 
 class DatabaseConsolidator:
@@ -21,7 +46,12 @@ class DatabaseConsolidator:
 
     def __init__(self):
         """Inicializa el consolidador de base de datos"""
-        self.datos_consolidados = []
+        # Una lista por columna (no un dict por registro): menos memoria y
+        # pd.DataFrame se construye directamente desde las listas
+        self.datos_consolidados = {columna: [] for columna in _COLUMNAS}
+        # DataFrame y estadísticas de los datos actuales; se invalidan al agregar o limpiar datos
+        self._df_cache: Optional[pd.DataFrame] = None
+        self._estadisticas_cache = None
 
     def agregar_datos_archivo(self, metadatos: Dict, contenido_extraido: Dict):
         """
@@ -37,44 +67,65 @@ class DatabaseConsolidator:
         tipo_doc = metadatos.get('tipo_documento', 'GENERAL')
         nombre_archivo = metadatos.get('nombre_archivo', '')
 
+        self._df_cache = None
+        self._estadisticas_cache = None
+
+        # Una sola marca de tiempo para todos los registros del archivo
+        fecha_procesamiento = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
         # Extraer propuestas
         propuestas = contenido_extraido.get('contenido', {}).get('propuestas', [])
 
         # Si hay propuestas, agregar cada una
         if propuestas:
             for propuesta in propuestas:
+                # Campos que no dependen de la fuente: se calculan una vez por propuesta
+                numero = propuesta.get('numero')
+                observacion = self._limpiar_texto_para_excel(propuesta.get('observacion_texto', ''))
+                texto_propuesta = self._limpiar_texto_para_excel(propuesta.get('propuesta_texto', ''))
+                hoja = propuesta.get('hoja', 'N/A')
+                fila = propuesta.get('fila', 'N/A')
+
                 for fuente in fuentes:
-                    registro = {
-                        'Ente': ente,
-                        'Fuente de Financiamiento': fuente,
-                        'Periodo': periodo,
-                        'Tipo Documento': tipo_doc,
-                        'Archivo Origen': nombre_archivo,
-                        'Número Propuesta': propuesta.get('numero'),
-                        'Observación': self._limpiar_texto_para_excel(propuesta.get('observacion_texto', '')),
-                        'Propuesta de Solventación': self._limpiar_texto_para_excel(propuesta.get('propuesta_texto', '')),
-                        'Hoja' : propuesta.get('hoja', 'N/A'),
-                        'Fila': propuesta.get('fila', 'N/A'),
-                        'Fecha Procesamiento': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    self.datos_consolidados.append(registro)
+                    self._agregar_registro((
+                        ente,
+                        fuente,
+                        periodo,
+                        tipo_doc,
+                        nombre_archivo,
+                        numero,
+                        observacion,
+                        texto_propuesta,
+                        hoja,
+                        fila,
+                        fecha_procesamiento
+                    ))
         else:
             # Si no hay propuestas, agregar registro de archivo sin propuestas
             for fuente in fuentes:
-                registro = {
-                    'Ente': ente,
-                    'Fuente de Financiamiento': fuente,
-                    'Periodo': periodo,
-                    'Tipo Documento': tipo_doc,
-                    'Archivo Origen': nombre_archivo,
-                    'Número Propuesta': 'N/A',
-                    'Observación': 'Sin propuestas detectadas',
-                    'Propuesta de Solventación': 'Sin propuestas detectadas en el archivo',
-                    'Hoja': 'N/A',
-                    'Fila': 'N/A',
-                    'Fecha Procesamiento': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                self.datos_consolidados.append(registro)
+                self._agregar_registro((
+                    ente,
+                    fuente,
+                    periodo,
+                    tipo_doc,
+                    nombre_archivo,
+                    'N/A',
+                    'Sin propuestas detectadas',
+                    'Sin propuestas detectadas en el archivo',
+                    'N/A',
+                    'N/A',
+                    fecha_procesamiento
+                ))
+
+    def _agregar_registro(self, valores: tuple):
+        """Agrega un registro (valores en el orden de _COLUMNAS) a las listas por columna"""
+        for lista, valor in zip(self.datos_consolidados.values(), valores):
+            lista.append(valor)
+
+    @property
+    def total_registros(self) -> int:
+        """Número de registros consolidados"""
+        return len(self.datos_consolidados['Ente'])
 
     def _limpiar_texto_para_excel(self, texto: str) -> str:
         """
@@ -92,14 +143,14 @@ class DatabaseConsolidator:
         # Convertir a string si no lo es
         texto = str(texto)
 
-        # Eliminar espacios múltiples
-        texto = re.sub(r'\s+', ' ', texto)
+        # Eliminar espacios múltiples (y los de los extremos)
+        texto = ' '.join(texto.split())
 
         # Limitar longitud (Excel tiene límite de 32,767 caracteres por celda)
         if len(texto) > 32000:
             texto = texto[:32000] + '... [TRUNCADO]'
 
-        return texto.strip()
+        return texto
 
     def generar_excel_consolidado(self, ruta_salida: str = 'base_datos_consolidada.xlsx'):
         """
@@ -111,11 +162,11 @@ class DatabaseConsolidator:
         Returns:
             Ruta del archivo generado
         """
-        if not self.datos_consolidados:
+        if not self.total_registros:
             raise ValueError("No hay datos para consolidar. Primero agregue datos con agregar_datos_archivo()")
 
-        # Crear DataFrame
-        df = pd.DataFrame(self.datos_consolidados)
+        # Crear DataFrame (o reutilizar el ya construido para estos datos)
+        df = self._obtener_dataframe()
 
         # Crear el libro de Excel
         wb = Workbook()
@@ -155,9 +206,10 @@ class DatabaseConsolidator:
             cell.font = header_font
             cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
 
-        # Escribir datos
-        for row in df.itertuples(index=False):
-            ws.append(list(row))
+        # Escribir datos directamente desde las listas por columna (mismo orden que
+        # el DataFrame), sin convertir cada fila desde pandas
+        for fila in zip(*self.datos_consolidados.values()):
+            ws.append(fila)
 
         # Ajustar anchos de columna
         column_widths = {
@@ -177,58 +229,56 @@ class DatabaseConsolidator:
         for col, width in column_widths.items():
             ws.column_dimensions[col].width = width
 
-        # Aplicar bordes y alineación a todas las celdas
+        # Aplicar bordes y alineación a todas las celdas.
+        # Un solo objeto de cada estilo para todas las celdas: openpyxl los busca en su
+        # tabla de estilos por igualdad, crear uno nuevo por celda solo añade trabajo
         thin_border = Border(
             left=Side(style='thin'),
             right=Side(style='thin'),
             top=Side(style='thin'),
             bottom=Side(style='thin')
         )
+        alineacion_datos = Alignment(vertical="top", wrap_text=True)
 
         for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
             for cell in row:
                 cell.border = thin_border
-                cell.alignment = Alignment(vertical="top", wrap_text=True)
+                cell.alignment = alineacion_datos
 
         # Congelar primera fila
         ws.freeze_panes = "A2"
 
     def _crear_hoja_por_ente(self, wb: Workbook, df: pd.DataFrame):
         """Crea hojas individuales por cada ente"""
-        entes = df['Ente'].unique()
-
-        for ente in sorted(entes):
+        # Un solo recorrido agrupa las filas de todos los entes (ordenados por nombre);
+        # las filas sin ente van a la hoja de DESCONOCIDO en lugar de descartarse
+        for ente, df_ente in df.groupby(df['Ente'].fillna('DESCONOCIDO'), sort=True):
             # Crear nombre de hoja válido (máximo 31 caracteres)
             nombre_hoja = f"Ente_{ente}"[:31]
             ws = wb.create_sheet(nombre_hoja)
 
-            # Filtrar datos del ente
-            df_ente = df[df['Ente'] == ente].copy()
-
             # Título de la hoja
             ws.merge_cells('A1:K1')
             titulo_cell = ws['A1']
             titulo_cell.value = f"ENTE: {ente}"
-            titulo_cell.font = Font(bold=True, size=16, color="FFFFFF")
-            titulo_cell.fill = PatternFill(start_color="203764", end_color="203764", fill_type="solid")
-            titulo_cell.alignment = Alignment(horizontal="center", vertical="center")
+            titulo_cell.font = _FUENTE_TITULO_ENTE
+            titulo_cell.fill = _RELLENO_TITULO
+            titulo_cell.alignment = _ALINEACION_TITULO
 
-            # Escribir datos
-            for r_idx, row in enumerate(dataframe_to_rows(df_ente, index=False, header=True), 2):
-                for c_idx, value in enumerate(row, 1):
-                    cell = ws.cell(row=r_idx, column=c_idx, value=value)
+            # Escribir encabezados (fila 2, debajo del título) con su estilo
+            ws.append(list(df_ente.columns))
+            for cell in next(ws.iter_rows(min_row=2, max_row=2, max_col=len(df_ente.columns))):
+                cell.font = _FUENTE_ENCABEZADO
+                cell.fill = _RELLENO_ENCABEZADO
+                cell.alignment = _ALINEACION_ENCABEZADO
 
-                    # Estilo de encabezado
-                    if r_idx == 2:
-                        cell.font = Font(bold=True)
-                        cell.fill = PatternFill(start_color="D0CECE", end_color="D0CECE", fill_type="solid")
-                        cell.alignment = Alignment(horizontal="center", wrap_text=True)
+            # Escribir datos fila por fila como tuplas simples
+            for row in df_ente.itertuples(index=False, name=None):
+                ws.append(row)
 
             # Ajustar columnas
-            for col in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K']:
-                ws.column_dimensions[col].width = 20
-
-            ws.column_dimensions['H'].width = 60  # Propuesta más ancha
+            for col, width in _ANCHOS_HOJA_ENTE.items():
+                ws.column_dimensions[col].width = width
 
     def _crear_hoja_por_fuente(self, wb: Workbook, df: pd.DataFrame):
         """Crea una hoja con resumen por fuente de financiamiento"""
@@ -238,22 +288,22 @@ class DatabaseConsolidator:
         ws.merge_cells('A1:E1')
         titulo_cell = ws['A1']
         titulo_cell.value = "RESUMEN POR FUENTE DE FINANCIAMIENTO"
-        titulo_cell.font = Font(bold=True, size=14, color="FFFFFF")
-        titulo_cell.fill = PatternFill(start_color="203764", end_color="203764", fill_type="solid")
-        titulo_cell.alignment = Alignment(horizontal="center", vertical="center")
+        titulo_cell.font = _FUENTE_TITULO
+        titulo_cell.fill = _RELLENO_TITULO
+        titulo_cell.alignment = _ALINEACION_TITULO
 
         # Agrupar por fuente
         resumen = df.groupby(['Fuente de Financiamiento', 'Ente']).size().reset_index(name='Total Propuestas')
 
         # Escribir resumen
-        for r_idx, row in enumerate(dataframe_to_rows(resumen, index=False, header=True), 2):
-            for c_idx, value in enumerate(row, 1):
-                cell = ws.cell(row=r_idx, column=c_idx, value=value)
+        ws.append(list(resumen.columns))
+        for cell in next(ws.iter_rows(min_row=2, max_row=2, max_col=len(resumen.columns))):
+            cell.font = _FUENTE_ENCABEZADO
+            cell.fill = _RELLENO_ENCABEZADO
+            cell.alignment = _ALINEACION_CENTRO
 
-                if r_idx == 2:
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color="D0CECE", end_color="D0CECE", fill_type="solid")
-                    cell.alignment = Alignment(horizontal="center")
+        for row in resumen.itertuples(index=False, name=None):
+            ws.append(row)
 
         # Ajustar columnas
         ws.column_dimensions['A'].width = 30
@@ -268,31 +318,30 @@ class DatabaseConsolidator:
         ws.merge_cells('A1:D1')
         titulo_cell = ws['A1']
         titulo_cell.value = "RESUMEN ESTADÍSTICO"
-        titulo_cell.font = Font(bold=True, size=14, color="FFFFFF")
-        titulo_cell.fill = PatternFill(start_color="203764", end_color="203764", fill_type="solid")
-        titulo_cell.alignment = Alignment(horizontal="center", vertical="center")
+        titulo_cell.font = _FUENTE_TITULO
+        titulo_cell.fill = _RELLENO_TITULO
+        titulo_cell.alignment = _ALINEACION_TITULO
 
-        # Estadísticas
+        # Estadísticas (las mismas que devuelve obtener_estadisticas, calculadas una vez)
+        resumen = self._calcular_estadisticas(df)
         estadisticas = [
-            ['Total de Archivos Procesados', df['Archivo Origen'].nunique()],
-            ['Total de Entes', df['Ente'].nunique()],
-            ['Total de Fuentes de Financiamiento', df['Fuente de Financiamiento'].nunique()],
-            ['Total de Propuestas', len(df)],
+            ['Total de Archivos Procesados', resumen['total_archivos']],
+            ['Total de Entes', resumen['total_entes']],
+            ['Total de Fuentes de Financiamiento', resumen['total_fuentes']],
+            ['Total de Propuestas', resumen['total_registros']],
             ['', ''],
             ['Distribución por Ente', ''],
         ]
 
         # Agregar distribución por ente
-        entes_count = df['Ente'].value_counts()
-        for ente, count in entes_count.items():
+        for ente, count in resumen['distribucion_por_ente'].items():
             estadisticas.append([f'  {ente}', count])
 
         estadisticas.append(['', ''])
         estadisticas.append(['Distribución por Fuente', ''])
 
         # Agregar distribución por fuente
-        fuentes_count = df['Fuente de Financiamiento'].value_counts()
-        for fuente, count in fuentes_count.items():
+        for fuente, count in resumen['distribucion_por_fuente'].items():
             estadisticas.append([f'  {fuente}', count])
 
         # Escribir estadísticas
@@ -302,8 +351,8 @@ class DatabaseConsolidator:
 
             # Estilo para títulos de sección
             if label and not label.startswith('  '):
-                ws[f'A{idx}'].font = Font(bold=True, size=12)
-                ws[f'A{idx}'].fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
+                ws[f'A{idx}'].font = _FUENTE_SECCION
+                ws[f'A{idx}'].fill = _RELLENO_SECCION
 
         # Ajustar columnas
         ws.column_dimensions['A'].width = 40
@@ -311,30 +360,47 @@ class DatabaseConsolidator:
 
     def limpiar_datos(self):
         """Limpia los datos consolidados para empezar una nueva consolidación"""
-        self.datos_consolidados = []
+        self.datos_consolidados = {columna: [] for columna in _COLUMNAS}
+        self._df_cache = None
+        self._estadisticas_cache = None
+
+    def _obtener_dataframe(self) -> pd.DataFrame:
+        """Devuelve el DataFrame de los datos consolidados, construyéndolo solo si cambiaron"""
+        if self._df_cache is None:
+            self._df_cache = pd.DataFrame(self.datos_consolidados)
+        return self._df_cache
+
+    def _calcular_estadisticas(self, df: pd.DataFrame) -> Dict:
+        """Calcula las estadísticas a partir del DataFrame y las guarda en caché"""
+        entes_count = df['Ente'].value_counts()
+        fuentes_count = df['Fuente de Financiamiento'].value_counts()
+
+        self._estadisticas_cache = {
+            'total_registros': len(df),
+            'total_archivos': df['Archivo Origen'].nunique(),
+            'total_entes': len(entes_count),
+            'total_fuentes': len(fuentes_count),
+            'entes': sorted(entes_count.index.tolist()),
+            'fuentes': sorted(fuentes_count.index.tolist()),
+            'distribucion_por_ente': entes_count.to_dict(),
+            'distribucion_por_fuente': fuentes_count.to_dict()
+        }
+        return self._estadisticas_cache
 
     def obtener_estadisticas(self) -> Dict:
         """
         Obtiene estadísticas de los datos consolidados
 
         Returns:
-            Diccionario con estadísticas
+            Diccionario con estadísticas (copia: modificarlo no altera la caché)
         """
-        if not self.datos_consolidados:
+        if not self.total_registros:
             return {'error': 'No hay datos consolidados'}
 
-        df = pd.DataFrame(self.datos_consolidados)
+        if self._estadisticas_cache is None:
+            self._calcular_estadisticas(self._obtener_dataframe())
 
-        return {
-            'total_registros': len(df),
-            'total_archivos': df['Archivo Origen'].nunique(),
-            'total_entes': df['Ente'].nunique(),
-            'total_fuentes': df['Fuente de Financiamiento'].nunique(),
-            'entes': sorted(df['Ente'].unique().tolist()),
-            'fuentes': sorted(df['Fuente de Financiamiento'].unique().tolist()),
-            'distribucion_por_ente': df['Ente'].value_counts().to_dict(),
-            'distribucion_por_fuente': df['Fuente de Financiamiento'].value_counts().to_dict()
-        }
+        return copy.deepcopy(self._estadisticas_cache)
 
 
 # Instancia global del consolidador
@@ -5,6 +5,8 @@ Usa comparación exacta (hash) y semántica (OpenAI) como respaldo
 
 import os
 import re
+import json
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from dotenv import load_dotenv
 from scripts.database import db
@@ -12,6 +14,20 @@ from scripts.database import db
 # Cargar variables de entorno
 load_dotenv()
 
+# Etiquetas HTML (precompilado para limpiar_html)
+_ETIQUETA_HTML_RE = re.compile(r'<[^>]+>')
+
+# Palabras para el prefiltro léxico (la puntuación pegada no forma parte del token)
+_PALABRA_RE = re.compile(r'\w+')
+
+# Vocales acentuadas y eñe sin diacríticos, para comparar palabras en el prefiltro
+_ACENTOS = str.maketrans('ÁÉÍÓÚÜÑáéíóúüñ', 'AEIOUUNaeiouun')
+
+# Prefiltro léxico antes de consultar a la IA: solo los candidatos con suficiente
+# coincidencia de palabras (Jaccard) y, de ellos, los más parecidos
+_JACCARD_MINIMO = 0.3
+_MAX_CANDIDATOS_IA = 5
+
 
 class DuplicateDetector:
     """Detector de propuestas duplicadas usando comparación exacta y IA"""
@@ -25,10 +41,9 @@ class DuplicateDetector:
         if not html_texto:
             return ""
         # Eliminar etiquetas HTML
-        texto_limpio = re.sub(r'<[^>]+>', '', html_texto)
-        # Normalizar espacios
-        texto_limpio = ' '.join(texto_limpio.split())
-        return texto_limpio.strip()
+        texto_limpio = _ETIQUETA_HTML_RE.sub('', html_texto)
+        # Normalizar espacios (split() ya descarta los de los extremos)
+        return ' '.join(texto_limpio.split())
 
     def comparar_exacto(self, texto1, texto2):
         """Comparación exacta de textos (ignorando formato HTML)"""
@@ -36,6 +51,11 @@ class DuplicateDetector:
         limpio2 = self.limpiar_html(texto2).lower()
         return limpio1 == limpio2
 
+    def _palabras(self, observacion_limpia, propuesta_limpia):
+        """Conjunto de palabras sin acentos ni puntuación para el prefiltro léxico"""
+        texto = f"{observacion_limpia} {propuesta_limpia}".translate(_ACENTOS).lower()
+        return set(_PALABRA_RE.findall(texto))
+
     def detectar_duplicado_con_ia(self, observacion_nueva, propuesta_nueva,
                                    observacion_existente, propuesta_existente):
         """
@@ -50,6 +70,16 @@ class DuplicateDetector:
                 'cambios_detectados': list
             }
         """
+        return self._comparar_con_ia(
+            self.limpiar_html(observacion_nueva),
+            self.limpiar_html(propuesta_nueva),
+            self.limpiar_html(observacion_existente),
+            self.limpiar_html(propuesta_existente)
+        )
+
+    def _comparar_con_ia(self, obs_nueva_limpia, prop_nueva_limpia,
+                         obs_exist_limpia, prop_exist_limpia):
+        """Igual que detectar_duplicado_con_ia, pero recibe textos ya limpios de HTML"""
         if not self.use_ai:
             return {
                 'es_duplicado': False,
@@ -60,12 +90,6 @@ class DuplicateDetector:
             }
 
         try:
-            # Limpiar HTML para análisis
-            obs_nueva_limpia = self.limpiar_html(observacion_nueva)
-            prop_nueva_limpia = self.limpiar_html(propuesta_nueva)
-            obs_exist_limpia = self.limpiar_html(observacion_existente)
-            prop_exist_limpia = self.limpiar_html(propuesta_existente)
-
             prompt = f"""Eres un experto en análisis de documentos de auditoría y solventación.
 
 Analiza estas dos propuestas de solventación y determina:
@@ -104,22 +128,12 @@ IMPORTANTE:
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.3,
-                max_tokens=500
+                max_tokens=500,
+                # Modo JSON: la API garantiza un objeto JSON válido, sin bloques markdown
+                response_format={"type": "json_object"}
             )
 
-            # Extraer respuesta JSON
-            import json
-            respuesta_texto = response.choices[0].message.content.strip()
-
-            # Limpiar markdown si existe
-            if respuesta_texto.startswith('```'):
-                respuesta_texto = respuesta_texto.split('```')[1]
-                if respuesta_texto.startswith('json'):
-                    respuesta_texto = respuesta_texto[4:]
-
-            resultado = json.loads(respuesta_texto)
-
-            return resultado
+            return json.loads(response.choices[0].message.content)
 
         except Exception as e:
             print(f"Error en detección con IA: {str(e)}")
@@ -172,19 +186,45 @@ IMPORTANTE:
         mejor_match = None
         resultado_ia = None
 
-        for propuesta_existente in propuestas_fuente:
-            # Comparar con IA
-            resultado = self.detectar_duplicado_con_ia(
-                observacion_texto,
-                propuesta_texto,
-                propuesta_existente['observacion_texto'],
-                propuesta_existente['propuesta_texto']
-            )
+        # La propuesta nueva se limpia una sola vez, no en cada comparación
+        obs_nueva_limpia = self.limpiar_html(observacion_texto)
+        prop_nueva_limpia = self.limpiar_html(propuesta_texto)
+        palabras_nueva = self._palabras(obs_nueva_limpia, prop_nueva_limpia)
 
-            if resultado['similitud'] > mejor_similitud:
-                mejor_similitud = resultado['similitud']
-                mejor_match = propuesta_existente
-                resultado_ia = resultado
+        # Prefiltro léxico: sin llamar a la IA se descartan los candidatos cuya
+        # similitud de Jaccard con la propuesta nueva es menor que _JACCARD_MINIMO (0.3)
+        candidatos = []
+        for propuesta_existente in propuestas_fuente:
+            obs_exist_limpia = self.limpiar_html(propuesta_existente['observacion_texto'])
+            prop_exist_limpia = self.limpiar_html(propuesta_existente['propuesta_texto'])
+            palabras_exist = self._palabras(obs_exist_limpia, prop_exist_limpia)
+            union = palabras_nueva | palabras_exist
+            jaccard = len(palabras_nueva & palabras_exist) / len(union) if union else 0
+            if jaccard >= _JACCARD_MINIMO:
+                candidatos.append((jaccard, propuesta_existente, obs_exist_limpia, prop_exist_limpia))
+
+        candidatos.sort(key=lambda candidato: candidato[0], reverse=True)
+        candidatos = candidatos[:_MAX_CANDIDATOS_IA]
+
+        # Comparar con IA: las llamadas son de red, se solapan en hilos (map conserva el orden).
+        # Sin candidatos o sin IA configurada no hay nada que comparar ni hilos que crear
+        if candidatos and self.use_ai:
+            with ThreadPoolExecutor(max_workers=len(candidatos)) as executor:
+                resultados = executor.map(
+                    lambda candidato: self._comparar_con_ia(
+                        obs_nueva_limpia,
+                        prop_nueva_limpia,
+                        candidato[2],
+                        candidato[3]
+                    ),
+                    candidatos
+                )
+
+                for (_, propuesta_existente, _, _), resultado in zip(candidatos, resultados):
+                    if resultado['similitud'] > mejor_similitud:
+                        mejor_similitud = resultado['similitud']
+                        mejor_match = propuesta_existente
+                        resultado_ia = resultado
 
         # 3. Tomar decisión basada en similitud
         if mejor_similitud >= 95 and resultado_ia and resultado_ia['es_duplicado']:
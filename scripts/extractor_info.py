@@ -6,6 +6,13 @@ Analiza nombres de archivos y contenido de documentos
 import re
 from pathlib import Path
 
+# Motor de lectura de Excel: calamine (Rust) si está instalado, openpyxl si no
+try:
+    import python_calamine  # noqa: F401
+    MOTOR_EXCEL = 'calamine'
+except ImportError:
+    MOTOR_EXCEL = 'openpyxl'
+
 
 class ExtractorInfo:
     """Extrae ENTE y fuente de financiamiento de archivos y documentos"""
@@ -33,7 +40,10 @@ class ExtractorInfo:
     ]
 
     def __init__(self):
-        pass
+        # Patrones y claves preparados una sola vez para las búsquedas por celda
+        self._entes_regex = tuple(re.compile(patron, re.IGNORECASE) for patron in self.ENTES_PATRONES)
+        self._fuentes_claves = tuple(self.FUENTES_CONOCIDAS)
+        self._fuentes_regex = re.compile('|'.join(re.escape(clave) for clave in self._fuentes_claves))
 
     def extraer_de_nombre_archivo(self, filename):
         """
@@ -62,8 +72,9 @@ class ExtractorInfo:
             }
 
         # Intentar patrón: [NOMBRE]_[FUENTE]
-        for fuente_key in self.FUENTES_CONOCIDAS.keys():
-            if fuente_key in filename.upper():
+        filename_upper = filename.upper()
+        for fuente_key in self._fuentes_claves:
+            if fuente_key in filename_upper:
                 # Extraer la parte antes de la fuente como ENTE
                 partes = filename.split('_')
                 ente_partes = []
@@ -107,8 +118,8 @@ class ExtractorInfo:
 
             # Buscar ENTE
             if not resultado['ente']:
-                for patron in self.ENTES_PATRONES:
-                    match = re.search(patron, texto, re.IGNORECASE)
+                for regex in self._entes_regex:
+                    match = regex.search(texto)
                     if match:
                         resultado['ente'] = match.group(1).strip()
                         break
@@ -117,21 +128,26 @@ class ExtractorInfo:
             if not resultado['fuente']:
                 texto_upper = texto.upper()
                 if 'FUENTE' in texto_upper or 'FINANCIAMIENTO' in texto_upper:
-                    for fuente_key in self.FUENTES_CONOCIDAS.keys():
+                    for fuente_key in self._fuentes_claves:
                         if fuente_key in texto_upper:
                             resultado['fuente'] = fuente_key
                             break
 
-        # Buscar en tablas
+            # Ambos datos encontrados: el resto del documento ya no aporta nada
+            if resultado['ente'] and resultado['fuente']:
+                return resultado
+
+        # Buscar en tablas: se lee el XML de filas y celdas directamente,
+        # sin construir objetos _Row/_Cell ni resolver celdas combinadas
         for tabla in doc.tables:
-            for fila in tabla.rows:
-                for celda in fila.cells:
-                    texto = celda.text.strip()
+            for tr in tabla._tbl.tr_lst:
+                for tc in tr.tc_lst:
+                    texto = '\n'.join(p.text for p in tc.p_lst).strip()
 
                     # Buscar ENTE
                     if not resultado['ente']:
-                        for patron in self.ENTES_PATRONES:
-                            match = re.search(patron, texto, re.IGNORECASE)
+                        for regex in self._entes_regex:
+                            match = regex.search(texto)
                             if match:
                                 resultado['ente'] = match.group(1).strip()
                                 break
@@ -139,11 +155,14 @@ class ExtractorInfo:
                     # Buscar fuente
                     if not resultado['fuente']:
                         texto_upper = texto.upper()
-                        for fuente_key in self.FUENTES_CONOCIDAS.keys():
+                        for fuente_key in self._fuentes_claves:
                             if fuente_key in texto_upper:
                                 resultado['fuente'] = fuente_key
                                 break
 
+                    if resultado['ente'] and resultado['fuente']:
+                        return resultado
+
         return resultado
 
     def extraer_de_documento_xlsx(self, filepath):
@@ -161,35 +180,38 @@ class ExtractorInfo:
         resultado = {'ente': None, 'fuente': None}
 
         try:
-            excel_data = pd.ExcelFile(filepath)
+            # Una sola lectura de todas las hojas, ya como texto y solo las
+            # primeras filas (típicamente contienen encabezados)
+            hojas = pd.read_excel(filepath, sheet_name=None, dtype=str, na_filter=False, nrows=20,
+                                  engine=MOTOR_EXCEL)
 
             # Buscar en todas las hojas
-            for sheet_name in excel_data.sheet_names:
-                df = excel_data.parse(sheet_name)
-
-                # Buscar en las primeras filas (típicamente contienen encabezados)
-                for i in range(min(20, len(df))):
-                    for col in df.columns:
-                        cell_value = str(df.iloc[i][col])
-
-                        # Buscar ENTE
-                        if not resultado['ente']:
-                            for patron in self.ENTES_PATRONES:
-                                match = re.search(patron, cell_value, re.IGNORECASE)
-                                if match:
-                                    resultado['ente'] = match.group(1).strip()
-                                    break
-
-                        # Buscar fuente
-                        if not resultado['fuente']:
-                            cell_upper = cell_value.upper()
-                            for fuente_key in self.FUENTES_CONOCIDAS.keys():
-                                if fuente_key in cell_upper:
-                                    resultado['fuente'] = fuente_key
-                                    break
-
-                    if resultado['ente'] and resultado['fuente']:
-                        break
+            for df in hojas.values():
+                # Se aplanan fila por fila para conservar el orden de recorrido celda a celda.
+                celdas = pd.Series(df.to_numpy(dtype=object).ravel())
+                if celdas.empty:
+                    continue
+
+                # Buscar ENTE: primera celda donde algún patrón coincide
+                if not resultado['ente']:
+                    grupos = pd.concat(
+                        [celdas.str.extract(regex)[0] for regex in self._entes_regex],
+                        axis=1
+                    )
+                    con_ente = grupos.notna().any(axis=1).to_numpy()
+                    if con_ente.any():
+                        resultado['ente'] = grupos.iloc[int(con_ente.argmax())].dropna().iloc[0].strip()
+
+                # Buscar fuente: primera celda que contiene alguna clave conocida
+                if not resultado['fuente']:
+                    celdas_upper = celdas.str.upper()
+                    con_fuente = celdas_upper.str.contains(self._fuentes_regex).to_numpy()
+                    if con_fuente.any():
+                        cell_upper = celdas_upper.iloc[int(con_fuente.argmax())]
+                        for fuente_key in self._fuentes_claves:
+                            if fuente_key in cell_upper:
+                                resultado['fuente'] = fuente_key
+                                break
 
                 if resultado['ente'] and resultado['fuente']:
                     break
@@ -4,9 +4,14 @@ Detecta y reporta imágenes dentro de propuestas, lo cual está prohibido
 """
 
 import os
+import time
+from bisect import bisect_left, bisect_right
 from typing import Dict, List, Optional
 from datetime import datetime
 
+# Segundos durante los que se reutiliza la misma fecha de validación
+_VIGENCIA_FECHA = 1.0
+
 
 class ImageValidator:
     """
@@ -17,6 +22,25 @@ class ImageValidator:
     def __init__(self):
         """Inicializa el validador de imágenes"""
         self.reportes = []
+        self._reiniciar_contadores()
+        # Fecha de validación compartida por los archivos de un mismo lote
+        self._fecha_lote = None
+        self._fecha_lote_instante = 0.0
+
+    def _reiniciar_contadores(self):
+        """Reinicia los totales que se acumulan conforme se valida cada archivo"""
+        self._archivos_validos = 0
+        self._archivos_con_advertencias = 0
+        self._total_imagenes = 0
+        self._archivos_problematicos = []
+
+    def _fecha_validacion(self) -> str:
+        """Devuelve la fecha ISO del lote actual, renovándola si tiene más de _VIGENCIA_FECHA segundos"""
+        instante = time.monotonic()
+        if self._fecha_lote is None or instante - self._fecha_lote_instante > _VIGENCIA_FECHA:
+            self._fecha_lote = datetime.now().isoformat()
+            self._fecha_lote_instante = instante
+        return self._fecha_lote
 
     def validar_propuestas_docx(self, nombre_archivo: str, contenido_extraido: Dict) -> Dict:
         """
@@ -32,7 +56,7 @@ class ImageValidator:
         reporte = {
             'nombre_archivo': nombre_archivo,
             'tipo_archivo': 'DOCX',
-            'fecha_validacion': datetime.now().isoformat(),
+            'fecha_validacion': self._fecha_validacion(),
             'tiene_imagenes_en_propuestas': False,
             'total_imagenes_documento': 0,
             'imagenes_detectadas': [],
@@ -61,7 +85,7 @@ class ImageValidator:
                 reporte['estado'] = 'ADVERTENCIA'
 
                 # Registrar las imágenes encontradas
-                for idx, imagen in enumerate(imagenes_detalles):
+                for imagen in imagenes_detalles:
                     reporte['imagenes_detectadas'].append({
                         'indice': imagen.get('indice'),
                         'tipo': imagen.get('tipo'),
@@ -70,12 +94,14 @@ class ImageValidator:
                         'ubicacion': 'Documento (ubicación exacta requiere análisis detallado)'
                     })
 
-                # Advertir sobre todas las propuestas
+                # Advertir sobre todas las propuestas (el mensaje es el mismo para todas)
+                advertencia = f'El documento contiene {total_imagenes} imagen(es). Revisar manualmente.'
+                agregar_propuesta = reporte['propuestas_con_imagenes'].append
                 for propuesta in propuestas:
-                    reporte['propuestas_con_imagenes'].append({
+                    agregar_propuesta({
                         'numero': propuesta.get('numero'),
                         'observacion': propuesta.get('observacion_texto', '')[:100],
-                        'advertencia': f'El documento contiene {total_imagenes} imagen(es). Revisar manualmente.'
+                        'advertencia': advertencia
                     })
 
         return reporte
@@ -94,7 +120,7 @@ class ImageValidator:
         reporte = {
             'nombre_archivo': nombre_archivo,
             'tipo_archivo': 'XLSX',
-            'fecha_validacion': datetime.now().isoformat(),
+            'fecha_validacion': self._fecha_validacion(),
             'tiene_imagenes_en_propuestas': False,
             'total_imagenes_documento': 0,
             'imagenes_detectadas': [],
@@ -111,59 +137,83 @@ class ImageValidator:
             hojas_completas = contenido_extraido.get('contenido', {}).get('hojas_completas', [])
             propuestas = contenido_extraido.get('contenido', {}).get('propuestas', [])
 
-            # Construir un mapa de hojas con imágenes
+            # Hojas en las que hay al menos una propuesta: solo para ellas se prepara
+            # la búsqueda de imágenes cercanas
+            hojas_propuestas = {propuesta.get('hoja') for propuesta in propuestas}
+
+            # Construir un mapa de hojas con imágenes: por hoja, su mensaje de advertencia
+            # y las filas de sus imágenes ordenadas (para buscar las cercanas por bisección)
             hojas_con_imagenes = {}
+            registrar_imagen = reporte['imagenes_detectadas'].append
             for hoja in hojas_completas:
                 nombre_hoja = hoja.get('nombre')
                 imagenes_hoja = hoja.get('imagenes', [])
 
                 if len(imagenes_hoja) > 0:
-                    hojas_con_imagenes[nombre_hoja] = imagenes_hoja
+                    con_propuestas = nombre_hoja in hojas_propuestas
+                    filas_imagenes = []
 
-                    # Registrar las imágenes
+                    # Registrar las imágenes (la posición se lee una sola vez por imagen)
                     for imagen in imagenes_hoja:
-                        posicion = imagen.get('posicion', {})
-                        reporte['imagenes_detectadas'].append({
+                        posicion = imagen.get('posicion')
+                        if posicion:
+                            columna_imagen = posicion.get('columna')
+                            fila_imagen = posicion.get('fila')
+                            if con_propuestas and fila_imagen is not None:
+                                filas_imagenes.append(fila_imagen)
+                        else:
+                            columna_imagen = fila_imagen = 'desconocida'
+
+                        registrar_imagen({
                             'hoja': nombre_hoja,
                             'indice': imagen.get('indice'),
                             'formato': imagen.get('formato'),
-                            'columna': posicion.get('columna') if posicion else 'desconocida',
-                            'fila': posicion.get('fila') if posicion else 'desconocida',
+                            'columna': columna_imagen,
+                            'fila': fila_imagen,
                             'tamaño_bytes': imagen.get('tamaño_bytes')
                         })
 
+                    # Las imágenes se registran siempre; el mapa solo interesa si hay propuestas
+                    if not con_propuestas:
+                        continue
+
+                    filas_imagenes.sort()
+                    hojas_con_imagenes[nombre_hoja] = (
+                        f'Hoja "{nombre_hoja}" contiene {len(imagenes_hoja)} imagen(es)',
+                        filas_imagenes
+                    )
+
             # Verificar si alguna propuesta está en una hoja con imágenes
+            agregar_propuesta = reporte['propuestas_con_imagenes'].append
             for propuesta in propuestas:
                 hoja_propuesta = propuesta.get('hoja')
                 fila_propuesta = propuesta.get('fila')
 
-                if hoja_propuesta in hojas_con_imagenes:
-                    # Hay imágenes en la misma hoja que la propuesta
-                    imagenes_hoja = hojas_con_imagenes[hoja_propuesta]
+                # Una sola búsqueda por propuesta en el mapa de hojas
+                info_hoja = hojas_con_imagenes.get(hoja_propuesta)
+                if info_hoja is None:
+                    continue
 
-                    # Verificar si hay imágenes cerca de la fila de la propuesta
-                    imagenes_cercanas = []
-                    for imagen in imagenes_hoja:
-                        posicion = imagen.get('posicion', {})
-                        if posicion:
-                            fila_imagen = posicion.get('fila')
-                            if fila_imagen is not None and fila_propuesta is not None:
-                                # Si la imagen está dentro de +/- 10 filas de la propuesta
-                                if abs(fila_imagen - fila_propuesta) <= 10:
-                                    imagenes_cercanas.append(imagen)
-
-                    if imagenes_cercanas or len(imagenes_hoja) > 0:
-                        reporte['tiene_imagenes_en_propuestas'] = True
-                        reporte['estado'] = 'ADVERTENCIA'
-
-                        reporte['propuestas_con_imagenes'].append({
-                            'numero': propuesta.get('numero'),
-                            'hoja': hoja_propuesta,
-                            'fila': fila_propuesta,
-                            'observacion': propuesta.get('observacion_texto', '')[:100],
-                            'advertencia': f'Hoja "{hoja_propuesta}" contiene {len(imagenes_hoja)} imagen(es)',
-                            'imagenes_cercanas': len(imagenes_cercanas)
-                        })
+                # Hay imágenes en la misma hoja que la propuesta (solo se registran hojas con al menos una)
+                advertencia, filas_imagenes = info_hoja
+
+                # Contar imágenes dentro de +/- 10 filas de la propuesta
+                imagenes_cercanas = 0
+                if fila_propuesta is not None:
+                    imagenes_cercanas = (bisect_right(filas_imagenes, fila_propuesta + 10)
+                                         - bisect_left(filas_imagenes, fila_propuesta - 10))
+
+                reporte['tiene_imagenes_en_propuestas'] = True
+                reporte['estado'] = 'ADVERTENCIA'
+
+                agregar_propuesta({
+                    'numero': propuesta.get('numero'),
+                    'hoja': hoja_propuesta,
+                    'fila': fila_propuesta,
+                    'observacion': propuesta.get('observacion_texto', '')[:100],
+                    'advertencia': advertencia,
+                    'imagenes_cercanas': imagenes_cercanas
+                })
 
         return reporte
 
@@ -188,12 +238,23 @@ class ImageValidator:
             reporte = {
                 'nombre_archivo': nombre_archivo,
                 'tipo_archivo': tipo_archivo,
-                'fecha_validacion': datetime.now().isoformat(),
+                'fecha_validacion': self._fecha_validacion(),
                 'estado': 'ERROR',
                 'error': f'Tipo de archivo no soportado: {tipo_archivo}'
             }
 
         self.reportes.append(reporte)
+
+        # Acumular totales para el reporte consolidado
+        estado = reporte.get('estado')
+        if estado == 'ADVERTENCIA':
+            self._archivos_con_advertencias += 1
+        elif estado == 'VÁLIDO':
+            self._archivos_validos += 1
+        self._total_imagenes += reporte.get('total_imagenes_documento', 0)
+        if reporte.get('tiene_imagenes_en_propuestas', False):
+            self._archivos_problematicos.append(reporte)
+
         return reporte
 
     def generar_reporte_consolidado(self) -> Dict:
@@ -203,10 +264,12 @@ class ImageValidator:
         Returns:
             Diccionario con el reporte consolidado
         """
+        # Los totales se acumulan en validar_archivo: no hay que recorrer los reportes
         total_archivos = len(self.reportes)
-        archivos_con_advertencias = sum(1 for r in self.reportes if r.get('estado') == 'ADVERTENCIA')
-        archivos_validos = sum(1 for r in self.reportes if r.get('estado') == 'VÁLIDO')
-        total_imagenes = sum(r.get('total_imagenes_documento', 0) for r in self.reportes)
+        archivos_con_advertencias = self._archivos_con_advertencias
+        archivos_validos = self._archivos_validos
+        total_imagenes = self._total_imagenes
+        archivos_problematicos = list(self._archivos_problematicos)
 
         reporte_consolidado = {
             'fecha_generacion': datetime.now().isoformat(),
@@ -220,12 +283,6 @@ class ImageValidator:
             'reportes_individuales': self.reportes
         }
 
-        # Crear lista de archivos problemáticos
-        archivos_problematicos = [
-            r for r in self.reportes
-            if r.get('tiene_imagenes_en_propuestas', False)
-        ]
-
         reporte_consolidado['archivos_con_imagenes_en_propuestas'] = archivos_problematicos
 
         return reporte_consolidado
@@ -233,6 +290,8 @@ class ImageValidator:
     def limpiar_reportes(self):
         """Limpia la lista de reportes para empezar una nueva validación"""
         self.reportes = []
+        self._reiniciar_contadores()
+        self._fecha_lote = None
 
 
 # Instancia global del validador